@@ -14,18 +14,51 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import time
+STARTED = time.perf_counter()
+
 from tkinter import *
-from tkinter import ttk
-from customtkinter import CTk, set_appearance_mode, CTkScrollableFrame
+from tkinter import ttk, filedialog
 from logger import Logger 
-from organizer.enums import Settings
-from PIL import Image, ImageTk
-import time
+from organizer.enums import Settings, enum
+from collections import OrderedDict
+import threading
+import os
+import sys
 
-class GuiHandler(CTk):
+ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "asset")
+ICON_CACHE = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache"), "filefusion", "icons")
+# (file under asset/, width, height); bump ICON_VERSION when the resizing changes
+ICONS = [(("icon.png",), 32, 28),
+         (("button", "home.png"), 50, 50),
+         (("button", "bolt.png"), 50, 50),
+         (("button", "store.png"), 50, 50),
+         (("button", "reload.png"), 50, 50),
+         (("button", "cog.png"), 50, 50)]
+ICON_VERSION = 1
+
+def icon_path(parts, width, height):
+    """
+    The icon resized to width x height as a PNG Tk reads by itself, rendered with Pillow only the first time.
+    The cache name carries the source's mtime, so an updated asset is rendered again.
+    """
+    source = os.path.join(ASSETS, *parts)
+    name = f"{'_'.join(parts)[:-4]}-{width}x{height}-{os.stat(source).st_mtime_ns}.png"
+    target = os.path.join(ICON_CACHE, f"v{ICON_VERSION}", name)
+    if not os.path.exists(target):
+        from PIL import Image
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with Image.open(source) as img:
+            img.resize((width, height), resample=Image.Resampling.LANCZOS).save(target + ".part", "PNG")
+        os.replace(target + ".part", target)
+    return target
+
+class GuiHandler(Tk):
 
     VERSION = "1.0.0"
     NAME = "FileFusion"
+    FRAME = 100
+    PHOTOS = 1024
 
     __doc__ = fr"""
     ______ _ _      ________        _             
@@ -45,6 +78,14 @@ class GuiHandler(CTk):
         self.geometry("800x500+60+60")
         self.minsize(800, 500)
         self.title("FileFusion")
+        self.watcher = None
+        self.job = None
+        self.progress = None
+        self.watch_stop = threading.Event()
+        self.thumbs = None
+        self.photos = OrderedDict()
+        self.store_files = []
+        self.store_view = None
 
         self.logger.info(f"Starting {self.NAME}...")
         self.logger.info(self.__doc__)
@@ -52,8 +93,9 @@ class GuiHandler(CTk):
         try:
             # Theme
             self.theme = Settings().get_theme()
-            set_appearance_mode(self.theme["theme"])
+            self.configure(bg=self.theme["bg"])
             self.load_images()
+            self.iconphoto(True, self.icons[0])
             ttk.Style(self).configure(".", background=self.theme["bg"], font=("Helvetica", 18), foreground=self.theme["fg"], relief="flat")
 
             # Sidebar Frame
@@ -101,6 +143,7 @@ class GuiHandler(CTk):
                 self.button.append(btn)
 
             self.Home()
+            self.after_idle(self.__started)
 
         except KeyboardInterrupt as e:
             self.logger.error(e)
@@ -109,20 +152,18 @@ class GuiHandler(CTk):
         except Exception as e:
             print(e)
     
+    def __started(self):
+        """
+        Runs once the first frame is drawn: logs the cold start time, and with --startup-time prints it and quits
+        """
+        self.startup = time.perf_counter() - STARTED
+        self.logger.info(f"Started in {self.startup:.3f}s")
+        if "--startup-time" in sys.argv:
+            print(f"{self.startup:.3f}")
+            self.destroy()
+
     def load_images(self):
-            self.icons = []
-            path = [(r"asset\icon.png", 32, 28),
-                (r"asset\button\home.png", 50, 50),
-                (r"asset\button\bolt.png", 50, 50),
-                (r"asset\button\store.png", 50, 50),
-                (r"asset\button\reload.png", 50, 50),
-                (r"asset\button\cog.png", 50, 50),
-            ]
-            for i in range(len(path)):
-                tmp = Image.open(path[i][0])
-                tmp = tmp.resize((path[i][1], path[i][2]), resample=Image.Resampling.LANCZOS)
-                tmp = ImageTk.PhotoImage(tmp)
-                self.icons.append(tmp)
+        self.icons = [PhotoImage(master=self, file=icon_path(*icon)) for icon in ICONS]
         
     def redraw(self):
         for w in self.canvas.winfo_children():
@@ -132,19 +173,126 @@ class GuiHandler(CTk):
         self.redraw()
         Label(self.canvas, text="FileFusion", font=("Helvetica", 115), fg=self.theme["fg"], bg=self.theme["bg"]).pack(side="top", expand=True, anchor="n", padx=0, pady=0, fill="both")
 
+    def __folder_row(self, text, var):
+        row = Frame(self.canvas, bg=self.theme["bg"])
+        row.pack(side="top", anchor="nw", fill="x", padx=10, pady=5)
+        ttk.Label(row, text=text, font=("Helvetica", 18)).pack(side="left")
+        ttk.Label(row, textvariable=var, font=("Helvetica", 14)).pack(side="left", padx=10)
+        ttk.Button(row, text="Browse", command=lambda: var.set(filedialog.askdirectory() or var.get())).pack(side="right")
+
     def organize(self):
         self.redraw()
-        pass
+
+        ttk.Label(self.canvas, text="Organize", font=("Helvetica", 72)).pack(side="top", anchor="nw", padx=10, pady=10)
+
+        if not hasattr(self, "organize_source"):
+            self.organize_source = StringVar(self, name="organize_source")
+            self.organize_dest = StringVar(self, name="organize_dest")
+            self.organize_status = StringVar(self, name="organize_status")
+
+        self.__folder_row("Source: ", self.organize_source)
+        self.__folder_row("Destination: ", self.organize_dest)
+
+        buttons = Frame(self.canvas, bg=self.theme["bg"])
+        buttons.pack(side="top", anchor="nw", padx=10, pady=10)
+        ttk.Button(buttons, text="Start", command=self.__start_job).pack(side="left")
+        self.pause_button = ttk.Button(buttons, text="Resume" if self.job and self.job.paused else "Pause", command=self.__pause_job)
+        self.pause_button.pack(side="left", padx=5)
+        ttk.Button(buttons, text="Cancel", command=lambda: self.job and self.job.cancel()).pack(side="left")
+
+        self.progress = ttk.Progressbar(self.canvas, maximum=1000)
+        self.progress.pack(side="top", fill="x", padx=10, pady=5)
+        ttk.Label(self.canvas, textvariable=self.organize_status, font=("Helvetica", 14)).pack(side="top", anchor="nw", padx=10)
+
+    def __start_job(self):
+        if self.job and self.job.alive():
+            return
+        if not (self.organize_source.get() and self.organize_dest.get()):
+            return
+        # The organizer is only needed once a page starts work, so it isn't imported at startup
+        from organizer.job import Job
+        self.job = Job(self.organize_source.get(), self.organize_dest.get(), [enum.TYPE.value, enum.DATE.value], workers=4)
+        self.job.start()
+        self.logger.info(f"Organizing {self.organize_source.get()} into {self.organize_dest.get()}")
+        self.after(self.FRAME, self.__poll_job)
+
+    def __pause_job(self):
+        if not (self.job and self.job.alive()):
+            return
+        if self.job.paused: self.job.resume()
+        else: self.job.pause()
+        self.pause_button.config(text="Resume" if self.job.paused else "Pause")
+
+    def __poll_job(self):
+        """
+        Redraw progress once per frame from the newest event, however many files finished in between
+        """
+        p = self.job.latest()
+        if p is not None:
+            eta = f", {p.eta:.0f}s left" if p.eta is not None else ""
+            total = f"/{p.total_files}" if p.total_files else ""
+            self.organize_status.set(f"{p.phase.capitalize()}: {p.files}{total} files, {p.bytes / 1048576:.1f} MiB{eta}")
+            if self.progress is not None and self.progress.winfo_exists():
+                done = p.bytes / p.total_bytes if p.total_bytes else (p.files / p.total_files if p.total_files else 0)
+                self.progress["value"] = 1000 * done
+        if self.job.alive() or not self.job.events.empty():
+            self.after(self.FRAME, self.__poll_job)
+        elif self.job.error:
+            self.logger.error(self.job.error)
     
     def automate(self):
         self.redraw()
-        pass
+
+        ttk.Label(self.canvas, text="Automate", font=("Helvetica", 72)).pack(side="top", anchor="nw", padx=10, pady=10)
+
+        if not hasattr(self, "watch_source"):
+            self.watch_source = StringVar(self, name="watch_source")
+            self.watch_dest = StringVar(self, name="watch_dest")
+
+        self.__folder_row("Watch folder: ", self.watch_source)
+        self.__folder_row("Destination: ", self.watch_dest)
+
+        running = self.watcher is not None and self.watcher.is_alive()
+        stopping = running and self.watch_stop.is_set()
+        self.watch_button = ttk.Button(self.canvas, text="Stopping..." if stopping else "Stop watching" if running else "Start watching",
+                                       command=self.__toggle_watch, state="disabled" if stopping else "normal")
+        self.watch_button.pack(side="top", anchor="nw", padx=10, pady=10)
+
+    def __toggle_watch(self):
+        if self.watcher is not None and self.watcher.is_alive():
+            # The watch ends once its current batch is organized, which can take a while, so it is
+            # polled from the event loop instead of joined
+            if not self.watch_stop.is_set():
+                self.watch_stop.set()
+                self.after(self.FRAME, self.__poll_watch)
+        elif self.watch_source.get() and self.watch_dest.get():
+            from organizer.watch import watch
+            self.watch_stop.clear()
+            self.watcher = threading.Thread(
+                target=watch,
+                args=(self.watch_source.get(), self.watch_dest.get(), [enum.TYPE.value, enum.DATE.value]),
+                kwargs={"stop": self.watch_stop},
+                daemon=True)
+            self.watcher.start()
+            self.logger.info(f"Watching {self.watch_source.get()}")
+        self.automate()
+
+    def __poll_watch(self):
+        if self.watcher.is_alive():
+            self.after(self.FRAME, self.__poll_watch)
+            return
+        self.logger.info("Stopped watching")
+        if self.watch_button.winfo_exists():
+            self.watch_button.configure(text="Start watching", state="normal")
     
     def settings(self):
         self.redraw()
 
         ttk.Label(self.canvas, text="Settings", font=("Helvetica", 72)).pack(side="top", anchor="nw", padx=10, pady=10)
 
+        # customtkinter is only needed here, so it isn't imported until the page opens
+        from customtkinter import CTkScrollableFrame, set_appearance_mode
+        set_appearance_mode(self.theme["theme"])
         canvas = CTkScrollableFrame(self.canvas, bg_color=self.theme["bg"], fg_color=self.theme["bg"], corner_radius=0)
         canvas.pack(side="top", expand=True, fill="both")
 
@@ -161,7 +309,108 @@ class GuiHandler(CTk):
 
     def store(self):
         self.redraw()
-        pass
+
+        ttk.Label(self.canvas, text="Store", font=("Helvetica", 72)).pack(side="top", anchor="nw", padx=10, pady=10)
+
+        if not hasattr(self, "store_folder"):
+            self.store_folder = StringVar(self, name="store_folder")
+            self.store_folder.trace_add("write", lambda *_: self.__open_store())
+        self.__folder_row("Library: ", self.store_folder)
+
+        frame = Frame(self.canvas, bg=self.theme["bg"])
+        frame.pack(side="top", expand=True, fill="both", padx=(10, 60), pady=10)
+        self.store_view = Canvas(frame, bg=self.theme["bg"], highlightthickness=0)
+        scroll = ttk.Scrollbar(frame, orient="vertical", command=self.__scroll_store)
+        self.store_view.configure(yscrollcommand=scroll.set)
+        scroll.pack(side="right", fill="y")
+        self.store_view.pack(side="left", expand=True, fill="both")
+        self.store_view.bind("<Configure>", lambda e: self.__draw_store())
+        self.store_view.bind("<MouseWheel>", lambda e: self.__scroll_store("scroll", -e.delta // 120, "units"))
+        self.store_view.bind("<Button-4>", lambda e: self.__scroll_store("scroll", -1, "units"))
+        self.store_view.bind("<Button-5>", lambda e: self.__scroll_store("scroll", 1, "units"))
+        self.store_cells = {}
+        self.store_shown = 0
+        self.after(self.FRAME, self.__poll_store)
+
+    def __open_store(self):
+        """
+        Start listing the library in the background; the grid fills in while the scan runs
+        """
+        folder = self.store_folder.get()
+        if not folder: return
+        if self.thumbs: self.thumbs.close()
+        from organizer.thumbnails import ThumbnailCache, images
+        self.thumbs = ThumbnailCache(folder)
+        self.photos.clear()
+        self.store_files = files = []
+        threading.Thread(target=lambda: files.extend(images(folder)), daemon=True).start()
+        if self.store_view is not None and self.store_view.winfo_exists():
+            self.store_view.delete("all")
+            self.store_cells = {}
+            self.store_shown = 0
+            self.store_view.yview_moveto(0)
+
+    def __scroll_store(self, *args):
+        self.store_view.yview(*args)
+        self.__draw_store()
+
+    def __photo(self, thumb):
+        """
+        PhotoImage of a cached thumbnail, keeping only the most recently shown ones in memory
+        """
+        if thumb in self.photos:
+            self.photos.move_to_end(thumb)
+            return self.photos[thumb]
+        from PIL import Image, ImageTk
+        try:
+            photo = self.photos[thumb] = ImageTk.PhotoImage(Image.open(thumb))
+        except OSError:
+            return None
+        if len(self.photos) > self.PHOTOS: self.photos.popitem(last=False)
+        return photo
+
+    def __draw_store(self):
+        """
+        Build items only for the rows in view and drop the rest, so the grid costs the same for any library size
+        """
+        view = self.store_view
+        if view is None or not view.winfo_exists() or self.thumbs is None: return
+        from organizer.thumbnails import SIZE
+        cell = SIZE + 16
+        width = max(view.winfo_width(), cell)
+        columns = max(1, width // cell)
+        count = len(self.store_files)
+        rows = -(-count // columns)
+        view.configure(scrollregion=(0, 0, columns * cell, rows * cell), yscrollincrement=cell // 2)
+        top = int(view.canvasy(0)) // cell
+        bottom = int(view.canvasy(view.winfo_height())) // cell + 1
+        visible = range(top * columns, min(count, (bottom + 1) * columns))
+
+        for i in [i for i in self.store_cells if i not in visible or self.store_cells[i][1] != columns]:
+            view.delete(self.store_cells.pop(i)[0])
+        for i in visible:
+            if i in self.store_cells and self.store_cells[i][2]: continue
+            record = self.store_files[i]
+            thumb = self.thumbs.get(record)
+            photo = self.__photo(thumb) if thumb else None
+            x, y = (i % columns) * cell + cell // 2, (i // columns) * cell + cell // 2
+            if i in self.store_cells: view.delete(self.store_cells.pop(i)[0])
+            if photo is not None:
+                item = view.create_image(x, y, image=photo)
+            else:
+                half = SIZE // 2
+                item = view.create_rectangle(x - half, y - half, x + half, y + half, outline=self.theme["fg"], dash=(2, 4))
+            self.store_cells[i] = (item, columns, photo is not None)
+        self.thumbs.keep([self.store_files[i] for i in visible])
+
+    def __poll_store(self):
+        view = self.store_view
+        if view is None or not view.winfo_exists(): return
+        # Redraw when the listing grew or renders finished, otherwise this is just a len() per frame
+        if self.thumbs and (self.thumbs.finished() or len(self.store_files) != self.store_shown):
+            self.store_shown = len(self.store_files)
+            self.__draw_store()
+        self.after(self.FRAME, self.__poll_store)
 
     def _animate_sidebar(self, cur_width, target_size, step_size, direction):
         if (direction == "expand" and cur_width < target_size) or (direction == "collapse" and cur_width > target_size):
@@ -180,6 +429,7 @@ class GuiHandler(CTk):
         theme = self.selected_theme.get()
         Settings().set_theme(theme)
         self.theme = Settings().get_theme()
+        from customtkinter import set_appearance_mode
         set_appearance_mode(theme)
         self.sidebar.update()
         self.update()
@@ -0,0 +1,206 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import random
+import shutil
+import struct
+import argparse
+import platform
+import statistics
+import tempfile
+import contextlib
+from datetime import datetime
+from organizer import FileOrganizer
+from organizer.enums import enum, Policy
+from organizer.metadata import EPOCH_1904
+from organizer.stats import human
+
+# Benchmark stage -> Stats phase of the organizer that does the work
+STAGES = {"scan": "scan", "classify": "metadata", "dedup": "hash", "transfer": "copy"}
+
+# Suffix and share of the generated files; photos and videos get real capture-date headers
+KINDS = [(".jpg", 0.45), (".mp4", 0.1), (".png", 0.1), (".pdf", 0.1), (".txt", 0.15), ("", 0.1)]
+MAGIC = {".png": b"\x89PNG\r\n\x1a\n", ".pdf": b"%PDF-1.7\n", "": b"PK\x03\x04"}
+
+def _ifd(entries, end):
+    # One IFD with its entries sorted by tag and no next IFD
+    data = struct.pack("<H", len(entries))
+    for tag, kind, count, value in sorted(entries):
+        data += struct.pack("<HHII", tag, kind, count, value)
+    return data + struct.pack("<I", end)
+
+def exif_jpeg(taken, size, rng):
+    """
+    A JPEG with an Exif APP1 block holding DateTimeOriginal, padded with noise up to size
+    """
+    stamp = datetime.fromtimestamp(taken).strftime("%Y:%m:%d %H:%M:%S").encode() + b"\0"
+    # TIFF header, IFD0 pointing at the Exif IFD, Exif IFD pointing at the date string
+    ifd0 = _ifd([(0x8769, 4, 1, 26)], 0)
+    exif = _ifd([(0x9003, 2, 20, 44)], 0)
+    tiff = b"II*\0" + struct.pack("<I", 8) + ifd0 + exif + stamp
+    app1 = b"Exif\0\0" + tiff
+    head = b"\xff\xd8" + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + b"\xff\xda"
+    return head + rng.randbytes(max(0, size - len(head)))
+
+def quicktime(taken, size, rng):
+    """
+    An MP4 whose moov/mvhd carries the creation time, followed by an mdat of noise
+    """
+    mvhd = struct.pack(">I4sB3xII", 20, b"mvhd", 0, int(taken) + EPOCH_1904, int(taken) + EPOCH_1904)
+    moov = struct.pack(">I4s", 8 + len(mvhd), b"moov") + mvhd
+    ftyp = struct.pack(">I4s4sI", 16, b"ftyp", b"isom", 512)
+    head = ftyp + moov
+    body = max(0, size - len(head) - 8)
+    return head + struct.pack(">I4s", body + 8, b"mdat") + rng.randbytes(body)
+
+def file_size(rng, median, spread):
+    # Log-normal, so most files are small and a few are very large, like a camera roll
+    return max(64, int(rng.lognormvariate(math.log(median), spread)))
+
+def generate(root, count=2000, depth=3, median=65536, spread=1.5, dupes=0.1, seed=1):
+    """
+    Build a synthetic source tree under root, the same for the same arguments.
+    A share dupes of the files are byte-identical copies of earlier ones under other names.
+    Returns (files, bytes) written.
+    """
+    rng = random.Random(seed)
+    folders = [root]
+    for level in range(depth):
+        folders += [os.path.join(f, f"dir{level}_{i}") for f in folders for i in range(2)]
+    for f in folders:
+        os.makedirs(f, exist_ok=True)
+
+    start = datetime(2015, 1, 1).timestamp()
+    suffixes, weights = zip(*KINDS)
+    written = []
+    total = 0
+    for n in range(count):
+        folder = rng.choice(folders)
+        if written and rng.random() < dupes:
+            original = rng.choice(written)
+            suffix = os.path.splitext(original)[1]
+            path = os.path.join(folder, f"copy_{n:06d}{suffix}")
+            shutil.copyfile(original, path)
+        else:
+            suffix = rng.choices(suffixes, weights)[0]
+            size = file_size(rng, median, spread)
+            taken = start + rng.random() * 10 * 365 * 86400
+            if suffix == ".jpg": data = exif_jpeg(taken, size, rng)
+            elif suffix == ".mp4": data = quicktime(taken, size, rng)
+            else: data = MAGIC.get(suffix, b"") + rng.randbytes(size)
+            path = os.path.join(folder, f"file_{n:06d}{suffix}")
+            with open(path, "wb") as f:
+                f.write(data)
+            os.utime(path, (taken, taken))
+            written.append(path)
+        total += os.path.getsize(path)
+    return count, total
+
+def measure(source, work, workers, repeat):
+    """
+    Organize source repeat times into fresh destinations and keep the median of every stage
+    """
+    runs = []
+    for n in range(repeat):
+        dest = os.path.join(work, f"dest{n}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            organizer = FileOrganizer(source, dest, [enum.TYPE.value, enum.DATE.value],
+                                      duplicates=Policy.SKIP.value, workers=workers)
+        runs.append(organizer.stats.report())
+        shutil.rmtree(dest)
+
+    stages = {}
+    for stage, phase in STAGES.items():
+        found = [r["phases"].get(phase) for r in runs]
+        found = [p for p in found if p]
+        if not found: continue
+        seconds = statistics.median(p["wall_seconds"] for p in found)
+        stages[stage] = {
+            "seconds": round(seconds, 6),
+            "cpu_seconds": round(statistics.median(p["cpu_seconds"] for p in found), 6),
+            "files": found[0]["files"],
+            "bytes": found[0]["bytes"],
+            "files_per_second": round(found[0]["files"] / seconds, 2) if seconds else None,
+            "bytes_per_second": round(found[0]["bytes"] / seconds, 2) if seconds else None,
+        }
+    return {"seconds": round(statistics.median(r["wall_seconds"] for r in runs), 6), "stages": stages}
+
+def compare(result, baseline, threshold):
+    """
+    Stages that got slower than the baseline by more than threshold, as printable lines
+    """
+    slower = []
+    if baseline.get("params") != result["params"]:
+        print("Warning: baseline was recorded with different parameters, the comparison is only a rough guide")
+    for stage, now in result["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before or not before["seconds"]: continue
+        change = now["seconds"] / before["seconds"] - 1
+        line = f"    {stage:<9} {before['seconds']:.4f}s -> {now['seconds']:.4f}s ({change:+.1%})"
+        print(line)
+        if change > threshold: slower.append(line.strip())
+    return slower
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FileFusion on a synthetic source tree")
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--median-size', type=int, default=65536)
+    parser.add_argument('--spread', type=float, default=1.5)
+    parser.add_argument('--dupes', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-w','--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--work', help="Folder for the generated tree, a temporary one by default")
+    parser.add_argument('--out', default="benchmark.json")
+    parser.add_argument('--baseline', help="Earlier --out file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    work = args.work or tempfile.mkdtemp(prefix="filefusion-bench-")
+    try:
+        source = os.path.join(work, "source")
+        shutil.rmtree(source, ignore_errors=True)
+        files, size = generate(source, args.files, args.depth, args.median_size, args.spread, args.dupes, args.seed)
+        print(f"Generated {files} files ({human(size)}) in '{source}'")
+
+        result = {
+            "params": {"files": args.files, "depth": args.depth, "median_size": args.median_size, "spread": args.spread,
+                       "dupes": args.dupes, "seed": args.seed, "workers": args.workers},
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            **measure(source, work, args.workers, args.repeat),
+        }
+        for stage, s in result["stages"].items():
+            print(f"    {stage:<9} {s['seconds']:.4f}s  {s['files_per_second'] or 0:>10.1f} files/s  "
+                  f"{human(s['bytes_per_second'] or 0)}/s")
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4)
+
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                slower = compare(result, json.load(f), args.threshold)
+            if slower:
+                print(f"Regressions over {args.threshold:.0%}:")
+                for line in slower: print(f"    {line}")
+                sys.exit(1)
+    finally:
+        if not args.work: shutil.rmtree(work, ignore_errors=True)
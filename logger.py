@@ -14,56 +14,120 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import logging
 import os
-from datetime import datetime
+import json
+import queue
+import atexit
+import logging
+import weakref
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+FORMAT = "[%(asctime)s] [%(name)s/%(levelname)s]: %(message)s"
+LOG_DIR = "logs"
+MAX_BYTES = 5 * 1048576
+BACKUPS = 5
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log shippers and jq
+    """
+    def format(self, record):
+        entry = {"time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"), "level": record.levelname,
+                 "name": record.name, "thread": record.threadName, "message": record.getMessage()}
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+class _Handoff(QueueHandler):
+    """
+    Queues the record as it is; the stock QueueHandler formats the message on the caller's thread
+    """
+    def prepare(self, record):
+        return record
+
+def _noop(*args, **kwargs):
+    pass
 
 class Logger:
-    def __init__(self, output=False):
-
-        os.makedirs("logs", exist_ok=True)
-        format = "[%(asctime)s] [%(name)s/%(levelname)s]: %(message)s"
-        log_file = os.path.join("logs", f"log_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log")
-
+    """
+    Shared by the whole process: the first Logger sets up one queue and one background listener,
+    later ones reuse them. Callers only put records on the queue; formatting, the rotating file
+    and the console are handled on the listener thread, so logging never waits on disk or terminal.
+    Messages take %-style args that are only formatted when the record is actually written.
+    The level is shared too, so change it with set_level(), which updates every instance.
+    """
+    __lock = threading.Lock()
+    __listener = None
+    __console = None
+    __instances = weakref.WeakSet()
+
+    def __init__(self, output=False, level=None, structured=None):
         self.logger = logging.getLogger(__class__.__name__)
-        self.logger.setLevel(logging.DEBUG)
-
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.DEBUG)
-
-        file_formatter = logging.Formatter(format, datefmt="%H:%M:%S")
-        file_handler.setFormatter(file_formatter)
-        self.logger.addHandler(file_handler)
-
-        if output:
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging.DEBUG)
-
-            console_formatter = logging.Formatter(format, datefmt="%H:%M:%S")
-            console_handler.setFormatter(console_formatter)
-
-            self.logger.addHandler(console_handler)
-
-    def debug(self, message):
-        self.logger.debug(message)
-    
-    def info(self, message):
-        self.logger.info(message)
-
-    def warning(self, message):
-        self.logger.warning(message)
-        print(message)
-    
-    def error(self, message):
-        self.logger.error(message)
-
-    def critical(self, message):
-        self.logger.critical(message)
+        with Logger.__lock:
+            if Logger.__listener is None:
+                Logger.__setup(self.logger, structured)
+            if output and Logger.__console is None:
+                # The listener is running, so the console handler joins it by restarting it
+                Logger.__console = logging.StreamHandler()
+                Logger.__console.setFormatter(Logger.__listener.handlers[0].formatter)
+                Logger.__listener.stop()
+                Logger.__listener.handlers += (Logger.__console,)
+                Logger.__listener.start()
+        Logger.__instances.add(self)
+        if level is not None:
+            self.set_level(level)
+        else:
+            self.refresh()
+
+    @staticmethod
+    def __setup(logger, structured):
+        os.makedirs(LOG_DIR, exist_ok=True)
+        if structured is None:
+            structured = os.environ.get("FILEFUSION_LOG_JSON") == "1"
+        formatter = JsonFormatter() if structured else logging.Formatter(FORMAT, datefmt="%H:%M:%S")
+        name = "filefusion.jsonl" if structured else "filefusion.log"
+        file_handler = RotatingFileHandler(os.path.join(LOG_DIR, name), maxBytes=MAX_BYTES,
+                                           backupCount=BACKUPS, encoding="utf-8", delay=True)
+        file_handler.setFormatter(formatter)
+
+        records = queue.SimpleQueue()
+        logger.handlers.clear()
+        logger.addHandler(_Handoff(records))
+        logger.setLevel(os.environ.get("FILEFUSION_LOG_LEVEL", "INFO").upper())
+        logger.propagate = False
+        Logger.__listener = QueueListener(records, file_handler, respect_handler_level=True)
+        Logger.__listener.start()
+        atexit.register(Logger.__listener.stop)
+
+    def refresh(self):
+        """
+        Rebind debug after the level changed; while DEBUG is off a per-file debug call is a no-op
+        """
+        self.debug = self.logger.debug if self.logger.isEnabledFor(logging.DEBUG) else _noop
+
+    def set_level(self, level):
+        self.logger.setLevel(level)
+        # The level belongs to the shared logging.Logger, so every instance's debug binding is stale now
+        for logger in list(Logger.__instances):
+            logger.refresh()
+
+    def info(self, message, *args):
+        self.logger.info(message, *args)
+
+    def warning(self, message, *args):
+        self.logger.warning(message, *args)
+
+    def error(self, message, *args):
+        self.logger.error(message, *args)
+
+    def critical(self, message, *args):
+        self.logger.critical(message, *args)
 
 if '__main__' == __name__:
-    log = Logger(True)
+    log = Logger(True, logging.DEBUG)
     log.debug("Debug")
     log.warning("Warning")
     log.info("Information")
     log.critical("Critical")
-    log.error("Error")
\ No newline at end of file
+    log.error("Error")
@@ -15,79 +15,804 @@ limitations under the License.
 """
 
 import os
-import shutil
 import time
-import argparse
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from enums import enum
+from organizer.enums import enum, Policy, Strategy, Settings
+from organizer.scanner import scan, scan_sources, stat_files, batches
+from organizer.archive import is_archive, walk, unpack, extract
+from organizer.duplicates import find_duplicates
+from organizer.similar import find_similar
+from organizer.sizes import SizeSketch, SizeBuckets
+from organizer.index import Index
+from organizer.transfer import Transfer
+from organizer import manifest
+from organizer.journal import Journal
+from organizer.metadata import MetadataCache, capture_time, SUFFIXES
+from organizer.classify import OTHER, category, sniff
+from organizer.plan import CONVERT, entry, directories, locality, read_plan, write_plan, summary
+from organizer.convert import Converter, output
+from organizer.stats import Stats, human
+
+class _Budget:
+    """
+    Caps the bytes and files queued for copying so scanning can't run ahead of the disks
+    """
+    def __init__(self, max_bytes, max_files):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.bytes = 0
+        self.files = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, size):
+        with self.cond:
+            # A file larger than the whole budget still goes through once the queue drains
+            while self.files and (self.files >= self.max_files or self.bytes + size > self.max_bytes):
+                self.cond.wait()
+            self.bytes += size
+            self.files += 1
+
+    def release(self, size):
+        with self.cond:
+            self.bytes -= size
+            self.files -= 1
+            self.cond.notify_all()
+
+class _Throttle:
+    """
+    Token bucket holding one source to rate bytes per second on average, shared by its copy workers
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            # Files larger than a second's worth go through and leave the bucket in debt
+            self.tokens -= size
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait: time.sleep(wait)
 
 class FileOrganizer:
-    def __init__(self, source, dest, ext=None, converter=False, duplicates=False):
-        self.__iter_files(source, dest, converter, duplicates, list(ext))
+    MAX_INFLIGHT = 256 * 1048576
+
+    def __init__(self, source, dest, ext=None, converter=False, duplicates=False, workers=1, skip_hidden=False, index=False,
+                 strategy=Strategy.COPY, resume=False, dry_run=False, plan_out=None, replay=None, files=None, job=None,
+                 report=None, metrics=None, limits=None, similar=None, checksum=False):
+        """
+        source is one folder or a list of them; a .zip or .tar source is read in place. limits maps a source folder to the bytes per second
+        its copies may read, with None as the key for every source. similar is the Hamming distance
+        up to which photos are reported as near-duplicates, None to not look for them.
+        checksum hashes every copy as it is written and records it in a manifest in each destination folder.
+        """
+        self.sources = [source] if isinstance(source, str) else list(source)
+        self.__roots = [os.path.join(os.path.abspath(s), "") for s in self.sources]
+        self.__archives = {i for i, s in enumerate(self.sources) if is_archive(s)}
+        self.__throttles = {}
+        for key, rate in (limits or {}).items():
+            for i, root in enumerate(self.__roots):
+                if rate and (key is None or root == os.path.join(os.path.abspath(key), "")):
+                    self.__throttles[i] = _Throttle(rate)
+        # Targets, and everything the index and journal record about them, are absolute paths,
+        # so the state in the destination means the same from any working directory
+        dest = os.path.abspath(dest)
+        self.workers = max(1, workers)
+        self.skip_hidden = skip_hidden
+        self.dry_run = dry_run
+        self.resume = resume
+        self.index = Index(dest, dry_run) if index else None
+        self.journal = None if dry_run else Journal(dest, resume)
+        self.policy = Policy(duplicates) if isinstance(duplicates, str) else Policy.SKIP
+        self.strategy = Strategy(strategy)
+        self.types = Settings().get_types()[0]
+        self.__transfers = {}
+        self.__claimed = set()
+        self.__existing = {}
+        self.__replace = set()
+        self.__targets = {}
+        self.__completed = set()
+        self.__failed = set()
+        self.__hashes = {}
+        self.__lock = threading.Lock()
+        self.unchanged = 0
+        self.files = files
+        self.job = job
+        self.dest = dest
+        self.similar = similar
+        self.checksum = checksum
+        self.__manifest = {}
+        self.stats = Stats()
+        self.__iter_files(dest, converter, duplicates, list(ext), dry_run, plan_out, replay)
+        if report: self.stats.write_json(report)
+        if metrics: self.stats.write_prometheus(metrics)
 
-    def __iter_files(self, source, dest, con, dup, ext):
+    def __iter_files(self, dest, con, dup, ext, dry_run, plan_out, replay):
         start = time.time()
-        if os.path.exists(source):
-            for root, dirs, files in os.walk(source):
-                for file in files:
-                    file_count =+ 1
-                    file_path = os.path.join(root, file)
-                    file_size =+ os.path.getsize(file_path)
-                    if con: self.convert_files(file_path)
-                    if dup: self.duplicate_find(file_path)
-                    self.organize(file_path, dest, ext)
+        if self.__streams(dup, ext, dry_run, plan_out, replay):
+            with self.stats.phase("copy"):
+                plan, complete = self.stream(dest, con, ext)
+        else:
+            with self.stats.phase("plan"):
+                plan = read_plan(replay) if replay else self.plan(dest, con, dup, ext)
+            if plan_out:
+                write_plan(plan_out, plan)
+            if dry_run:
+                print(summary(plan))
+                if self.index: self.index.close()
+                return
+            with self.stats.phase("copy"):
+                complete = self.execute(plan)
+
+        # What really reached the destination in this run, not what was planned
+        file_count = self.stats.files["copy"]
+        file_size = self.stats.bytes["copy"]
+        skipped = sum(1 for e in plan if e.strategy == Policy.SKIP.value)
+        if self.unchanged: print(f"Skipped {self.unchanged} files unchanged since the last run")
+        if skipped: print(f"Skipped {skipped} duplicate files")
+        if self.__failed: print(f"Failed to organize {len(self.__failed)} files")
+
+        elapsed = time.time() - start
+        partial = "" if complete else " before the run was interrupted"
+        print(f"\nOrganized {file_count} files ({human(file_size)}){partial} in {elapsed:.3f} seconds")
+        print(f"Throughput: {human(file_size / max(elapsed, 1e-9))}/s, {file_count / max(elapsed, 1e-9):.1f} files/s with {self.workers} worker(s)")
+
+    def plan(self, dest, con, dup, ext):
+        """
+        Decide where every file goes without touching the destination
+        """
+        plan = []
+        sources = self.__present()
+        if not sources:
+            return plan
+        if self.job: self.job.phase("scan")
+
+        # Sources are scanned side by side and their records interleave however the devices keep up.
+        # Each source walks in a fixed order, so sorting by source restores the same order on every
+        # run and name collisions resolve the same way.
+        rank = {}
+        if self.files is None:
+            # A destination inside a source is never scanned back in
+            scanned = scan_sources(sources, self.skip_hidden, walk=walk, exclude={self.dest})
+            records = self.stats.timed("scan", self.__ranked(scanned, rank), lambda r: r.size)
         else:
-            print(f"Source folder '{source}' does not exist. Skipping...")
-                
-        print(f"\nOrganized {file_count}({file_size/1073741824}) files in {time.time() - start:.3f} seconds")
+            records = self.stats.timed("stat", stat_files(self.files), lambda r: r.size)
+        order = lambda r: rank.get(r.path, 0)
+        sketch = None
+        if enum.SIZE.value in ext:
+            # Adaptive size buckets come from every scanned size, before anything is filtered out
+            sketch = SizeSketch()
+            records = self.__sketched(records, sketch)
+        if self.index:
+            known = {}
+            for source in sources: known.update(self.index.known(source))
+            fresh = []
+            for r in records:
+                if Index.unchanged(known, r): self.unchanged += 1
+                else: fresh.append(r)
+            records = fresh
+        dupes = {}
+        if dup:
+            records = sorted(records, key=order)
+            if self.job: self.job.phase("hash", len(records))
+            with self.stats.phase("hash"):
+                # Archive members would have to be read just to hash them, so they are left out
+                dupes = self.duplicate_find([r for r in records if not self.__packed(r.path)])
+            if self.job: self.job.phase("scan", len(records))
+        if self.similar is not None:
+            records = sorted(records, key=order)
+            if self.job: self.job.phase("similar", len(records))
+            with self.stats.phase("similar"):
+                self.similar_find([r for r in records if r.path not in dupes and not self.__packed(r.path)])
+            if self.job: self.job.phase("scan", len(records))
+
+        dates = MetadataCache(dest, self.dry_run) if enum.DATE.value in ext else None
+        convert = Settings().get_convert() if con else None
+        described = []
+        for d in self.stats.timed("metadata", self.__describe(records, ext, dates), lambda d: d[0].size):
+            if self.job:
+                self.job.checkpoint()
+                self.job.advance(d[0].size, d[0].path)
+            described.append(d)
+        described.sort(key=lambda d: order(d[0]))
+        if sketch: self.sizes = SizeBuckets.load(dest, Settings().get_size(), sketch, not self.dry_run)
+
+        for record, taken, kind in described:
+            original = dupes.get(record.path)
+            kept = None if original is None else self.__targets.get(original, original)
+            if kept is not None and self.policy == Policy.SKIP:
+                plan.append(entry(record, kept, Policy.SKIP.value))
+                continue
+            via = kept if self.policy == Policy.LINK else None
+            target = self.__targets[record.path] = self.organize(record, dest, ext, taken, kind)
+            if target is None: continue
+            if original is not None and kept is None:
+                # The original could not be placed, so this copy is organized instead and stands in for it
+                self.__targets[original] = target
+            if via is None: plan.append(entry(record, target, self.strategy.value))
+            else: plan.append(entry(record, target, Policy.LINK.value, via))
+            converted = self.__conversion(record, target, convert) if via is None else None
+            if converted: plan.append(converted)
+        if dates: dates.close()
+        return plan
+
+    def __present(self):
+        sources = []
+        for source in self.sources:
+            if os.path.exists(source): sources.append(source)
+            else: print(f"Source folder '{source}' does not exist. Skipping...")
+        return sources
+
+    def __conversion(self, record, target, convert):
+        """
+        The entry making a converted copy next to the organized file from it once it is in place,
+        or None when the file isn't converted
+        """
+        if not convert or os.path.splitext(record.path)[1].lower() not in convert["from"]:
+            return None
+        # When the file replaces what an earlier run made of it, its conversion replaces the old output too
+        converted = self.__claim(output(target, convert), replace=target in self.__replace)
+        return entry(record, converted, CONVERT, target)
+
+    @staticmethod
+    def __sketched(records, sketch):
+        for record in records:
+            sketch.add(record.size)
+            yield record
+
+    @staticmethod
+    def __ranked(tagged, rank):
+        for i, record in tagged:
+            rank[record.path] = i
+            yield record
+
+    def __lane(self, path):
+        """
+        Index of the source folder a file was found in, the longest match for nested sources
+        """
+        path = os.path.abspath(path)
+        found, length = 0, -1
+        for i, root in enumerate(self.__roots):
+            if path.startswith(root) and len(root) > length:
+                found, length = i, len(root)
+        return found
+
+    def __packed(self, path):
+        """
+        Whether path is a member of an archive source
+        """
+        if not self.__archives: return False
+        path = os.path.abspath(path)
+        return any(path.startswith(self.__roots[i]) for i in self.__archives)
+
+    def __streams(self, dup, ext, dry_run, plan_out, replay):
+        """
+        Whether every source can be planned and copied on its own lane, without waiting for the others.
+        Duplicates, near-duplicates and adaptive size buckets still to be worked out compare files
+        across all sources, and a dry, saved, replayed or resumed run needs the whole plan first,
+        so those plan everything before copying anything.
+        """
+        if dup or self.similar is not None or dry_run or plan_out or replay or self.resume or self.files is not None:
+            return False
+        if enum.SIZE.value in ext and SizeBuckets.known(self.dest, Settings().get_size()) is None:
+            return False
+        return len(self.sources) > 1 or bool(self.__archives)
+
+    def stream(self, dest, con, ext):
+        """
+        Plan and copy every source on its own lane, so a fast source is done copying while a slow one
+        is still being scanned. A lane scans and describes its source, then stages each file next to
+        where it goes. Names are claimed here, a source at a time in the order they were given, which
+        is the order a planned run claims them in, so colliding names resolve the same way; a staged
+        file is renamed into place once its source has its names.
+        Returns the plan that was carried out and whether the run went to the end.
+        """
+        plan = []
+        present = set(self.__present())
+        lanes = [i for i, source in enumerate(self.sources) if source in present]
+        if not lanes:
+            return plan, True
+        if enum.SIZE.value in ext: self.sizes = SizeBuckets.known(dest, Settings().get_size())
+        convert = Settings().get_convert() if con else None
+        known = [self.index.known(self.sources[i]) if self.index else {} for i in lanes]
+        self.__stop = threading.Event()
+        self.__lane_error = None
+        self.__converter = Converter(dest, convert, self.stats) if convert else None
+        self.__convert_after = {}
+        self.__named = {}
+        self.__pending = defaultdict(list)
+        planned = queue.Queue()
+        if self.job: self.job.phase("copy")
+        threads = [threading.Thread(target=self.__stream_lane, args=(i, k, ext, planned), daemon=True)
+                   for i, k in zip(lanes, known)]
+        complete = False
+        try:
+            for t in threads: t.start()
+            ready = {}
+            for lane in lanes:
+                # A source planned before the ones ahead of it waits here for its names, not for its data
+                while lane not in ready:
+                    i, wanted = planned.get()
+                    ready[i] = wanted
+                plan += self.__name(lane, ready.pop(lane), convert)
+            for t in threads: t.join()
+            if self.__lane_error: raise self.__lane_error
+            if self.__converter:
+                if self.job: self.job.phase("convert", sum(1 for e in plan if e.strategy == CONVERT))
+                with self.stats.phase("convert"):
+                    converted, reused = self.__converter.finish()
+                print(f"Converted {converted} files, {reused} of them reused from the cache")
+            complete = True
+        except KeyboardInterrupt:
+            print("\nInterrupted, run again with --resume to pick up where this run stopped")
+        finally:
+            if not complete:
+                self.__stop.set()
+                for t in threads: t.join()
+                # Files staged for a source that never got its names are dropped again
+                for staged in self.__pending.values():
+                    for source, transfer, part, digest, seconds in staged: transfer.discard(source, part)
+                if self.__converter: self.__converter.finish(cancel=True)
+            self.journal.close(complete and not self.__failed)
+            if self.checksum:
+                manifest.write(self.__manifest)
+            if self.index:
+                self.__save_index(plan)
+        return plan, complete
+
+    def __stream_lane(self, lane, known, ext, planned):
+        told = False
+        try:
+            if lane in self.__archives:
+                wanted = self.__extract(lane, known, ext)
+            else:
+                wanted = self.__scan(lane, known, ext)
+            planned.put((lane, wanted))
+            told = True
+            if lane not in self.__archives: self.__stage_all(lane, wanted)
+        except BaseException as e:
+            # Cancelling or failing one lane stops the others, stream() re-raises it
+            self.__lane_error = e
+            self.__stop.set()
+        finally:
+            if not told: planned.put((lane, None))
+
+    def __scan(self, lane, known, ext):
+        """
+        Scan and describe one source folder, returning (record, target before claiming) in scan order
+        """
+        records = []
+        for r in scan(self.sources[lane], self.skip_hidden, {self.dest}):
+            if self.__stop.is_set(): return []
+            if self.job: self.job.checkpoint()
+            self.stats.count("scan", 1, r.size)
+            if Index.unchanged(known, r):
+                with self.__lock: self.unchanged += 1
+            else: records.append(r)
+        dates = MetadataCache(self.dest) if enum.DATE.value in ext else None
+        try:
+            described = list(self.__describe(records, ext, dates))
+        finally:
+            if dates: dates.close()
+        wanted = []
+        for record, taken, kind in described:
+            target = self.__where(record, self.dest, ext, taken, kind)
+            if target is not None: wanted.append((record, target))
+        return wanted
+
+    def __extract(self, lane, known, ext):
+        """
+        Plan and stage the members of an archive source in a single read through it, so a compressed
+        tar isn't decompressed once to list it and once more to copy it
+        """
+        wanted = []
+        transfer = self.__transfer(Strategy.COPY.value)
+
+        def place(record):
+            self.stats.count("scan", 1, record.size)
+            if Index.unchanged(known, record):
+                with self.__lock: self.unchanged += 1
+                return None
+            # Archive members keep the date stored with them and are classified by name
+            target = self.__where(record, self.dest, ext)
+            if target is None: return None
+            folder, name = os.path.split(target)
+            os.makedirs(folder, exist_ok=True)
+            wanted.append((record, target))
+            return os.path.join(folder, f".{name}.{lane}-{len(wanted)}.part")
+
+        for record, part, seconds, digest, error in extract(self.sources[lane], place, self.skip_hidden):
+            if error:
+                self.__failed.add(record.path)
+                print(f"Error organizing file: '{record.path}': {error}")
+            else:
+                self.__staged(lane, record.path, transfer, part, digest, seconds)
+            if self.__stop.is_set(): break
+            if self.job: self.job.checkpoint()
+            if lane in self.__throttles: self.__throttles[lane].acquire(record.size)
+        return wanted
+
+    def __stage_all(self, lane, wanted):
+        """
+        Stage one source's files in locality order, on a pool when there are several workers
+        """
+        for folder in sorted({os.path.dirname(target) for record, target in wanted}):
+            os.makedirs(folder, exist_ok=True)
+        pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        budget = _Budget(self.MAX_INFLIGHT, self.workers * 4)
+        stopped = True
+        try:
+            for n, e in enumerate(sorted((entry(r, t, self.strategy.value) for r, t in wanted), key=locality)):
+                if self.__stop.is_set(): return
+                if self.job: self.job.checkpoint()
+                if pool is None:
+                    self.__stage(lane, n, e)
+                else:
+                    budget.acquire(e.size)
+                    pool.submit(self.__stage, lane, n, e, budget)
+            stopped = False
+        finally:
+            if pool: pool.shutdown(wait=True, cancel_futures=stopped)
+
+    def __stage(self, lane, n, e, budget=None):
+        transfer = self.__transfer(e.strategy)
+        try:
+            if lane in self.__throttles: self.__throttles[lane].acquire(e.size)
+            start = time.perf_counter()
+            # Staged under a name of its own, two files may be headed for the same name before claiming
+            part, digest = transfer.stage(e.source, e.target, e.device, f".{lane}-{n}")
+            self.__staged(lane, e.source, transfer, part, digest, time.perf_counter() - start)
+        except Exception as err:
+            self.__failed.add(e.source)
+            print(f"Error organizing file: '{e.source}': {err}")
+        finally:
+            if budget: budget.release(e.size)
+
+    def __staged(self, lane, source, transfer, part, digest, seconds):
+        """
+        Put a staged file in place if its source has its names, else keep it until it does
+        """
+        with self.__lock:
+            named = self.__named.get(lane)
+            if named is None:
+                self.__pending[lane].append((source, transfer, part, digest, seconds))
+                return
+        self.__commit(named[source], transfer, part, digest, seconds)
+
+    def __name(self, lane, wanted, convert):
+        """
+        Claim the names of one source's files, then put in place whatever it has staged so far
+        """
+        copies, plan, named = [], [], {}
+        for record, target in wanted or ():
+            e = named[record.path] = entry(record, self.__claim(target, record.path), self.strategy.value)
+            copies.append(e)
+            plan.append(e)
+            converted = self.__conversion(record, e.target, convert)
+            if converted:
+                self.__convert_after[e.target] = converted
+                plan.append(converted)
+        # Journaled before any of them is in place so an interrupted run knows what may be missing
+        self.journal.plan(copies)
+        if self.job: self.job.extend(len(copies), sum(e.size for e in copies))
+        with self.__lock:
+            self.__named[lane] = named
+            staged = self.__pending.pop(lane, [])
+        for source, transfer, part, digest, seconds in staged:
+            self.__commit(named[source], transfer, part, digest, seconds)
+        return plan
+
+    def __commit(self, e, transfer, part, digest, seconds):
+        try:
+            transfer.commit(e.source, part, e.target, e.target in self.__replace)
+            self.__check(e, digest)
+            self.__finished(e, seconds, digest)
+        except Exception as err:
+            self.__failed.add(e.source)
+            print(f"Error organizing file: '{e.source}': {err}")
+
+    def execute(self, plan):
+        """
+        Create every destination folder once, then run the transfers grouped by source location.
+        Every source folder copies on its own lane so a slow device doesn't hold up the others.
+        Links to duplicates go last so every original has finished copying.
+        Returns whether the run went to the end rather than being interrupted.
+        """
+        self.__stop = threading.Event()
+        complete = False
+        conversions = [e for e in plan if e.strategy == CONVERT]
+        # Conversions start as soon as the file they read is in place, keyed by that file
+        self.__converter = Converter(self.dest, Settings().get_convert(), self.stats) if conversions else None
+        self.__convert_after = {e.via: e for e in conversions}
+        try:
+            for folder in directories(plan):
+                os.makedirs(folder, exist_ok=True)
+
+            todo = []
+            for e in plan:
+                if e.strategy in (Policy.SKIP.value, CONVERT): continue
+                if self.journal.is_finished(e):
+                    self.__completed.add(e.source)
+                    self.__convert(e)
+                else: todo.append(e)
+            if self.job: self.job.phase("copy", len(todo), sum(e.size for e in todo))
+            lanes = defaultdict(list)
+            for e in sorted((e for e in todo if e.strategy != Policy.LINK.value), key=locality):
+                lanes[self.__lane(e.source)].append(e)
+            links = [e for e in todo if e.strategy == Policy.LINK.value]
+
+            if len(lanes) == 1:
+                self.__drain(*lanes.popitem())
+            elif lanes:
+                self.__lane_error = None
+                threads = [threading.Thread(target=self.__run_lane, args=item, daemon=True) for item in lanes.items()]
+                for t in threads: t.start()
+                try:
+                    for t in threads: t.join()
+                except BaseException:
+                    self.__stop.set()
+                    for t in threads: t.join()
+                    raise
+                if self.__lane_error: raise self.__lane_error
+
+            for batch in batches(links, Journal.BATCH):
+                self.journal.plan(batch)
+                for e in batch: self.__copy(e)
+            if self.__converter:
+                if self.job: self.job.phase("convert", len(conversions))
+                with self.stats.phase("convert"):
+                    converted, reused = self.__converter.finish()
+                print(f"Converted {converted} files, {reused} of them reused from the cache")
+            complete = True
+        except KeyboardInterrupt:
+            print("\nInterrupted, run again with --resume to pick up where this run stopped")
+        finally:
+            if self.__converter and not complete: self.__converter.finish(cancel=True)
+            self.journal.close(complete and not self.__failed)
+            if self.checksum:
+                manifest.write(self.__manifest)
+            if self.index:
+                self.__save_index(plan)
+        return complete
+
+    def __run_lane(self, lane, copies):
+        try:
+            self.__drain(lane, copies)
+        except BaseException as e:
+            # Cancelling or failing one lane stops the others, execute() re-raises it
+            self.__lane_error = e
+            self.__stop.set()
+
+    def __drain(self, lane, copies):
+        """
+        Copy one source's files in locality order, on a pool when there are several workers
+        """
+        if lane in self.__archives:
+            return self.__unpack(lane, copies)
+        pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        budget = _Budget(self.MAX_INFLIGHT, self.workers * 4)
+        stopped = True
+        try:
+            for batch in batches(copies, Journal.BATCH):
+                # Journaled before the batch starts so an interrupted run knows what may be missing
+                self.journal.plan(batch)
+                for e in batch:
+                    if self.__stop.is_set(): return
+                    if self.job: self.job.checkpoint()
+                    if pool is None:
+                        self.__copy(e, lane)
+                    else:
+                        budget.acquire(e.size)
+                        pool.submit(self.__copy, e, lane, budget)
+            stopped = False
+        finally:
+            if pool: pool.shutdown(wait=True, cancel_futures=stopped)
+
+    def __unpack(self, lane, copies):
+        """
+        Extract the members of an archive source in the order it stores them, reading it once
+        """
+        self.journal.plan(copies)
+        for e, seconds, digest, error in unpack(self.sources[lane], copies, self.__replace):
+            if error:
+                self.__failed.add(e.source)
+                print(f"Error organizing file: '{e.source}': {error}")
+            else:
+                self.__finished(e, seconds, digest)
+            if self.__stop.is_set(): return
+            if self.job: self.job.checkpoint()
+            if lane in self.__throttles: self.__throttles[lane].acquire(e.size)
+
+    def __describe(self, records, ext, dates):
+        """
+        Yield (record, capture time, category) in scan order.
+        Headers are only read for what the rules need, a batch at a time on a pool.
+        """
+        want_date = enum.DATE.value in ext
+        want_type = enum.TYPE.value in ext
+        with ThreadPoolExecutor(max(4, self.workers)) as pool:
+            for chunk in batches(records):
+                taken = {}
+                if want_date:
+                    taken = dates.get(chunk)
+                    # Archive members keep the date stored with them
+                    todo = [r for r in chunk if r.path not in taken and os.path.splitext(r.path)[1].lower() in SUFFIXES
+                            and not self.__packed(r.path)]
+                    found = pool.map(lambda r: capture_time(r.path, r.size), todo)
+                    parsed = list(zip(todo, found))
+                    if parsed: dates.put(parsed)
+                    taken.update((r.path, t) for r, t in parsed)
 
-    def organize(self, file_path: str, dest, ext:list):
+                kinds = {}
+                if want_type:
+                    kinds = {r.path: category(self.types, r.path) for r in chunk}
+                    # Unknown or missing extensions are classified by their magic bytes instead
+                    todo = [p for p, k in kinds.items() if k is None and not self.__packed(p)]
+                    for p, suffix in zip(todo, pool.map(sniff, todo)):
+                        kinds[p] = self.types.get(suffix, OTHER)
+                    for p, k in kinds.items():
+                        if k is None: kinds[p] = OTHER
+
+                for r in chunk:
+                    yield r, taken.get(r.path), kinds.get(r.path)
+
+    def organize(self, record, dest, ext:list, taken=None, kind=None):
+        """
+        Claim the destination path of one file from the rules in ext
+        """
+        target = self.__where(record, dest, ext, taken, kind)
+        return None if target is None else self.__claim(target, record.path)
+
+    def __where(self, record, dest, ext, taken=None, kind=None):
+        """
+        Where the rules in ext put one file, before its name is claimed
+        """
+        file_path = record.path
         try:
+            folder = dest
             for v in ext:
                 if v == enum.DATE.value:
-                    file_time = os.path.getmtime(file_path)
-                    date = datetime.fromtimestamp(file_time)
-                    year_folder = os.path.join(dest, str(date.year))
-                    month_folder = os.path.join(year_folder, date.strftime("%B"))
-                    os.makedirs(month_folder, exist_ok=True)
-                    shutil.copy2(file_path, os.path.join(month_folder, os.path.basename(file_path)))
-                    file_path = os.path.join(month_folder, os.path.basename(file_path))
+                    # Capture time from EXIF/QuickTime headers when known, else the file's mtime
+                    date = datetime.fromtimestamp(record.mtime if taken is None else taken)
+                    year_folder = os.path.join(folder, str(date.year))
+                    folder = os.path.join(year_folder, date.strftime("%B"))
                 if v == enum.APP.value: pass
-                if v == enum.TYPE.value: pass
-                if v == enum.SIZE.value: pass
+                if v == enum.TYPE.value:
+                    folder = os.path.join(folder, kind or category(self.types, file_path) or OTHER)
+                if v == enum.SIZE.value:
+                    folder = os.path.join(folder, self.sizes.name(record.size))
+
+            return os.path.join(folder, os.path.basename(file_path))
 
         except Exception as e:
             print(f"Error organizing file: '{file_path}': {e}")
-    
-    def duplicate_find(self, file):
-        pass
-
-    def convert_files(self, file):
-        pass
-
-if __name__ == "__main__":
-    enums = enum()
-    parser = argparse.ArgumentParser()
-    parser.add_argument('inputs', nargs='*', required=True)
-
-    parser.add_argument('-c','--convert', action='store_true')
-    parser.add_argument('-d','--duplicate', action='store_true')
-    parser.add_argument('-h','--help', action='store_true')
-
-    parser.add_argument(
-        "--ext", 
-        nargs="+",
-        required=True
-    )
-
-    args = parser.parse_args()
-    if not args.help:
-        FileOrganizer(args.inputs[:-1],
-                    args.inputs[-1],
-                    args.ext,
-                    converter=args.convert,
-                    duplicates=args.duplicate)
-    else:
-        print(""" """)
-    
+
+    def __save_index(self, plan):
+        # Only files that really reached the destination, in this run or an earlier one
+        missing = {e.target for e in plan if e.strategy != Policy.SKIP.value and e.source not in self.__completed}
+        rows = []
+        for e in plan:
+            if e.target in missing or e.strategy == CONVERT: continue
+            partial, full = self.__hashes.pop(e.source, (None, None))
+            rows.append((e, partial, full))
+        self.index.add(rows)
+        # Whatever is left are hashes newly computed for files organized by earlier runs
+        self.index.update_hashes(self.__hashes)
+        self.index.close()
+
+    def __claim(self, target, source=None, replace=False):
+        """
+        Reserve a destination path for this run, first come first served in scan order.
+        A file already on disk is only taken over when an earlier run put it there from source,
+        or when the caller knows it did (replace).
+        """
+        base, suffix = os.path.splitext(target)
+        n = 1
+        while target in self.__claimed or (self.__exists(target) and not ((replace and n == 1) or self.__made(source, target))):
+            target = f"{base} ({n}){suffix}"
+            n += 1
+        self.__claimed.add(target)
+        if self.__exists(target): self.__replace.add(target)
+        return target
+
+    def __exists(self, path):
+        # Each destination folder is listed once, not stat'ed once per file
+        folder, name = os.path.split(path)
+        if folder not in self.__existing:
+            try:
+                self.__existing[folder] = set(os.listdir(folder))
+            except OSError:
+                self.__existing[folder] = set()
+        return name in self.__existing[folder]
+
+    def __made(self, source, target):
+        """
+        Whether target is what an interrupted or indexed earlier run made of source
+        """
+        if source is None: return False
+        if self.journal and self.journal.planned.get(os.path.abspath(source)) == target: return True
+        return bool(self.index and self.index.made(source, target))
+
+    def __transfer(self, strategy):
+        if strategy not in self.__transfers:
+            # Links to duplicates are hardlinks that fall back to a copy across filesystems
+            mode = Strategy.HARDLINK if strategy == Policy.LINK.value else Strategy(strategy)
+            self.__transfers[strategy] = Transfer(mode, self.checksum)
+        return self.__transfers[strategy]
+
+    def __copy(self, e, lane=None, budget=None):
+        try:
+            if lane in self.__throttles: self.__throttles[lane].acquire(e.size)
+            start = time.perf_counter()
+            digest = self.__transfer(e.strategy)(e.via or e.source, e.target, None if e.via else e.device,
+                                                 e.target in self.__replace)
+            self.__check(e, digest)
+            self.__finished(e, time.perf_counter() - start, digest)
+        except Exception as err:
+            self.__failed.add(e.source)
+            print(f"Error organizing file: '{e.source}': {err}")
+        finally:
+            if budget: budget.release(e.size)
+
+    def __check(self, e, digest):
+        known = (self.__hashes.get(e.source) or [None, None])[1]
+        if digest and known and digest != known:
+            raise OSError(f"content changed while organizing, hash {digest} instead of {known}")
+
+    def __finished(self, e, seconds, digest=None):
+        if digest:
+            # Kept with the duplicate hashes, so the index and the conversion cache don't hash the file again
+            self.__hashes.setdefault(e.source, [None, None])[1] = digest
+        if self.checksum:
+            full = (self.__hashes.get(e.source) or [None, None])[1]
+            self.__manifest[e.target] = manifest.Row(os.path.basename(e.target), e.size, full, e.mtime)
+        self.stats.record("copy", seconds, e.size)
+        self.__completed.add(e.source)
+        self.journal.done(e)
+        self.__convert(e)
+        if self.job: self.job.advance(e.size, e.target)
+
+    def similar_find(self, records):
+        """
+        Report photos that look alike without being identical. They are organized as usual,
+        since a smaller or re-compressed copy is still a different file.
+        """
+        groups = find_similar(records, max(4, self.workers), self.similar, stats=self.stats)
+        for group in groups:
+            print(f"Near-duplicates of '{group[0].path}':")
+            for r in group[1:]: print(f"    {r.path}")
+        return groups
+
+    def __convert(self, e):
+        """
+        Hand the conversion reading e's organized file to the process pool, if one is planned
+        """
+        c = self.__convert_after.pop(e.target, None)
+        if c is not None and os.path.exists(e.target):
+            self.__converter.submit(c, e.target, (self.__hashes.get(e.source) or [None, None])[1],
+                                    c.target in self.__replace)
+
+    def duplicate_find(self, records):
+        """
+        Map every duplicate's path to the path of the first copy found
+        """
+        dupes = {}
+        if self.index:
+            # Files organized by earlier runs go first so they are kept as the originals
+            records = self.index.organized({r.size for r in records}, self.__hashes) + records
+        for group in find_duplicates(records, max(4, self.workers), self.__hashes, self.stats):
+            if self.policy == Policy.REPORT:
+                print(f"Duplicates of '{group[0].path}' ({group[0].size} bytes):")
+                for r in group[1:]: print(f"    {r.path}")
+            for r in group[1:]:
+                dupes[r.path] = group[0].path
+        return dupes
 
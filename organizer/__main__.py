@@ -0,0 +1,112 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import argparse
+import cProfile
+import pstats
+from organizer import FileOrganizer
+from organizer.enums import enum, Policy, Strategy
+from organizer.index import Index
+from organizer.watch import watch
+from organizer.stats import parse_size
+from organizer.similar import DISTANCE
+from organizer.manifest import verify
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('inputs', nargs='+')
+
+    parser.add_argument('-c','--convert', action='store_true')
+    parser.add_argument('-d','--duplicate', nargs='?', const=Policy.SKIP.value, choices=[p.value for p in Policy])
+    parser.add_argument('-h','--help', action='store_true')
+    parser.add_argument('-w','--workers', type=int, default=1)
+    parser.add_argument('--skip-hidden', action='store_true')
+    parser.add_argument('-i','--index', action='store_true')
+    parser.add_argument('--compact', action='store_true')
+    parser.add_argument('-s','--strategy', default=Strategy.COPY.value, choices=[s.value for s in Strategy])
+    parser.add_argument('-r','--resume', action='store_true')
+    parser.add_argument('-n','--dry-run', action='store_true')
+    parser.add_argument('--plan-out')
+    parser.add_argument('--replay')
+    parser.add_argument('--watch', action='store_true')
+    parser.add_argument('--report')
+    parser.add_argument('--metrics')
+    parser.add_argument('--similar', nargs='?', type=int, const=DISTANCE)
+    parser.add_argument('--limit', action='append', default=[])
+    parser.add_argument('--profile', nargs='?', const='filefusion.prof')
+    parser.add_argument('--checksum', action='store_true')
+    parser.add_argument('--verify', action='store_true')
+    parser.add_argument('--sample', type=float)
+
+    parser.add_argument(
+        "--ext", 
+        nargs="+",
+        default=[enum.DATE.value]
+    )
+
+    args = parser.parse_args()
+    # --limit 40M caps every source, --limit /mnt/usb=20M just that one
+    limits = {}
+    for limit in args.limit:
+        folder, _, rate = limit.rpartition("=")
+        limits[folder or None] = parse_size(rate)
+    if args.compact:
+        index = Index(args.inputs[-1])
+        print(f"Removed {index.compact()} stale entries from the index")
+        index.close()
+    elif args.verify:
+        # Checks the library given as the last input against the manifests --checksum wrote
+        if verify(args.inputs[-1], max(4, args.workers), args.sample): sys.exit(1)
+    elif args.watch:
+        watch(args.inputs[0],
+              args.inputs[-1],
+              args.ext,
+              duplicates=args.duplicate,
+              workers=args.workers,
+              index=args.index,
+              strategy=args.strategy,
+              limits=limits,
+              checksum=args.checksum)
+    elif not args.help:
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler: profiler.enable()
+        FileOrganizer(args.inputs[:-1],
+                    args.inputs[-1],
+                    args.ext,
+                    converter=args.convert,
+                    duplicates=args.duplicate,
+                    workers=args.workers,
+                    skip_hidden=args.skip_hidden,
+                    index=args.index,
+                    strategy=args.strategy,
+                    resume=args.resume,
+                    dry_run=args.dry_run,
+                    plan_out=args.plan_out,
+                    replay=args.replay,
+                    report=args.report,
+                    metrics=args.metrics,
+                    limits=limits,
+                    similar=args.similar,
+                    checksum=args.checksum)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    else:
+        print(""" """)
+    
+
@@ -0,0 +1,194 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import time
+import tarfile
+import zipfile
+from datetime import datetime
+from organizer.scanner import FileRecord, SYSTEM_DIRS, scan
+from organizer.duplicates import hasher
+from organizer.transfer import publish
+
+SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+CHUNK = 1048576
+
+def is_archive(path):
+    return os.path.isfile(path) and path.lower().endswith(SUFFIXES)
+
+def _parts(name):
+    # Tars made with "tar -C folder ." name their members ./DCIM/...
+    return [part for part in name.split("/") if part not in ("", ".")]
+
+def _hidden(name):
+    return any(part.startswith(".") or part in SYSTEM_DIRS for part in _parts(name))
+
+def _skipped(name, skip_hidden):
+    """
+    Whether a member is left out: hidden ones when asked, and always those whose path climbs
+    out with "..", which would name a file outside the archive
+    """
+    if ".." in _parts(name):
+        print(f"Skipping archive member '{name}': its path leaves the archive")
+        return True
+    return skip_hidden and _hidden(name)
+
+def _zip_record(archive, info, st):
+    try:
+        taken = datetime(*info.date_time).timestamp()
+    except (ValueError, OverflowError):
+        taken = st.st_mtime
+    return FileRecord(os.path.join(archive, *_parts(info.filename)), info.file_size, taken, info.header_offset,
+                      st.st_dev)
+
+def _tar_record(archive, info, st):
+    return FileRecord(os.path.join(archive, *_parts(info.name)), info.size, float(info.mtime), info.offset,
+                      st.st_dev)
+
+def members(archive, skip_hidden=False):
+    """
+    One FileRecord per file in archive, read from the zip central directory or the tar headers.
+    Paths look like <archive>/<member>, inode is the member's offset so sorting by it gives
+    the order the archive is stored in, and mtime is the member's own timestamp, or the
+    archive's when the member has none (zips can hold a zeroed 1980-00-00 date).
+    """
+    st = os.stat(archive)
+    try:
+        if archive.lower().endswith(".zip"):
+            with zipfile.ZipFile(archive) as z:
+                for info in z.infolist():
+                    if info.is_dir() or _skipped(info.filename, skip_hidden): continue
+                    yield _zip_record(archive, info, st)
+        else:
+            # Uncompressed tars seek from header to header, but a compressed one has to be decompressed
+            # whole just to list it, and unpack() decompresses it again; only extract() does both at once
+            with tarfile.open(archive, "r:*") as t:
+                for info in t:
+                    if not info.isfile() or _skipped(info.name, skip_hidden): continue
+                    yield _tar_record(archive, info, st)
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        print(f"Error reading archive '{archive}': {e}")
+
+def walk(source, skip_hidden=False, exclude=()):
+    """
+    Records of a source folder or archive
+    """
+    return members(source, skip_hidden) if is_archive(source) else scan(source, skip_hidden, exclude)
+
+def _spool(stream, part, mtime):
+    """
+    Stream one member into part, hashing it on the way, and return the hash
+    """
+    h = hasher()
+    try:
+        with open(part, "wb") as out:
+            while block := stream.read(CHUNK):
+                h.update(block)
+                out.write(block)
+        os.utime(part, (mtime, mtime))
+    except BaseException:
+        # A member that fails halfway leaves nothing behind, like a failed transfer
+        if os.path.lexists(part): os.remove(part)
+        raise
+    return h.hexdigest()
+
+def _write(stream, e, replace):
+    """
+    Stream one member to its target, hashing it on the way, and return the hash
+    """
+    part = os.path.join(os.path.dirname(e.target), f".{os.path.basename(e.target)}.part")
+    digest = _spool(stream, part, e.mtime)
+    try:
+        publish(part, e.target, replace)
+    except BaseException:
+        if os.path.lexists(part): os.remove(part)
+        raise
+    return digest
+
+def unpack(archive, entries, replace=()):
+    """
+    Write every plan entry whose source is a member of archive to its target, reading the archive
+    once from start to end. Yields (entry, seconds, content hash, error) as each member is done.
+    Only targets in replace may already exist. A compressed tar listed by members() is read twice.
+    """
+    wanted = {e.source: e for e in entries}
+    path = lambda name: os.path.join(archive, *_parts(name))
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as z:
+            # Central directory order is close to storage order, header offsets make it exact
+            for info in sorted(z.infolist(), key=lambda i: i.header_offset):
+                e = wanted.pop(path(info.filename), None)
+                if e is None: continue
+                start = time.perf_counter()
+                try:
+                    with z.open(info) as stream:
+                        digest = _write(stream, e, e.target in replace)
+                    yield e, time.perf_counter() - start, digest, None
+                except (OSError, zipfile.BadZipFile, RuntimeError) as err:
+                    yield e, 0.0, None, err
+    else:
+        # A pure stream: each member is read right where the tar holds it, without seeking back
+        with tarfile.open(archive, "r|*") as t:
+            for info in t:
+                e = wanted.pop(path(info.name), None)
+                if e is None: continue
+                start = time.perf_counter()
+                try:
+                    digest = _write(t.extractfile(info), e, e.target in replace)
+                    yield e, time.perf_counter() - start, digest, None
+                except (OSError, tarfile.TarError) as err:
+                    yield e, 0.0, None, err
+    for e in wanted.values():
+        yield e, 0.0, None, FileNotFoundError(f"not in archive '{archive}'")
+
+def extract(archive, place, skip_hidden=False):
+    """
+    List and write out the members of archive in a single read from start to end, for when
+    a compressed tar would otherwise be decompressed once to plan and once more to copy.
+    place(record) is asked for each member as it comes by and returns the part file to write
+    it to, or None to leave it out. Yields (record, part, seconds, content hash, error).
+    """
+    st = os.stat(archive)
+    try:
+        if archive.lower().endswith(".zip"):
+            with zipfile.ZipFile(archive) as z:
+                for info in sorted(z.infolist(), key=lambda i: i.header_offset):
+                    if info.is_dir() or _skipped(info.filename, skip_hidden): continue
+                    record = _zip_record(archive, info, st)
+                    part = place(record)
+                    if part is None: continue
+                    start = time.perf_counter()
+                    try:
+                        with z.open(info) as stream:
+                            digest = _spool(stream, part, record.mtime)
+                        yield record, part, time.perf_counter() - start, digest, None
+                    except (OSError, zipfile.BadZipFile, RuntimeError) as err:
+                        yield record, part, 0.0, None, err
+        else:
+            with tarfile.open(archive, "r|*") as t:
+                for info in t:
+                    if not info.isfile() or _skipped(info.name, skip_hidden): continue
+                    record = _tar_record(archive, info, st)
+                    part = place(record)
+                    if part is None: continue
+                    start = time.perf_counter()
+                    try:
+                        digest = _spool(t.extractfile(info), part, record.mtime)
+                        yield record, part, time.perf_counter() - start, digest, None
+                    except (OSError, tarfile.TarError) as err:
+                        yield record, part, 0.0, None, err
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        print(f"Error reading archive '{archive}': {e}")
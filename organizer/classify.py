@@ -0,0 +1,83 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+
+HEADER = 32
+OTHER = "other"
+
+# (offset, magic bytes, suffix it stands for); checked in order, so specific entries go first
+MAGIC = [
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (0, b"GIF87a", ".gif"),
+    (0, b"GIF89a", ".gif"),
+    (0, b"II*\0", ".tif"),
+    (0, b"MM\0*", ".tif"),
+    (0, b"%PDF", ".pdf"),
+    (0, b"\x1aE\xdf\xa3", ".mkv"),
+    (0, b"FLV", ".flv"),
+    (0, b"\0\0\1\xba", ".mpg"),
+    (0, b"0&\xb2u\x8ef\xcf\x11", ".wmv"),
+    (0, b".RMF", ".rm"),
+    (8, b"WEBP", ".webp"),
+    (8, b"AVI ", ".avi"),
+    (8, b"heic", ".heic"),
+    (8, b"heix", ".heic"),
+    (8, b"mif1", ".heif"),
+    (8, b"qt  ", ".mov"),
+    (8, b"3gp", ".3gp"),
+    (8, b"3g2", ".3g2"),
+    (8, b"M4V", ".m4v"),
+    (4, b"ftyp", ".mp4"),
+    (4, b"moov", ".mov"),
+    (4, b"mdat", ".mov"),
+    (4, b"wide", ".mov"),
+    (0, b"BM", ".bmp"),
+]
+
+def compile_types(types, presets):
+    """
+    Build the lookups the TYPE rule runs on:
+    lowercased suffix -> category, and preset -> every suffix of its categories.
+    Presets naming a category that doesn't exist are skipped.
+    """
+    index = {}
+    for category, suffixes in types.items():
+        for suffix in suffixes:
+            index.setdefault(suffix.lower(), category)
+    expanded = {name: frozenset(s for s, c in index.items() if c in categories) for name, categories in presets.items()}
+    return index, expanded
+
+def sniff(path):
+    """
+    Suffix matching the magic bytes at the start of path, or None
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEADER)
+    except OSError:
+        return None
+    for offset, magic, suffix in MAGIC:
+        if head[offset:offset + len(magic)] == magic:
+            return suffix
+    return None
+
+def category(index, path):
+    """
+    Category from the suffix alone; None means the header has to be sniffed
+    """
+    return index.get(os.path.splitext(path)[1].lower())
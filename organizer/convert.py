@@ -0,0 +1,191 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import io
+import os
+import time
+import shutil
+import struct
+import sqlite3
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from organizer.index import STATE_DIR
+from organizer.duplicates import full_hash
+from organizer.transfer import publish
+
+FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+RAW = {".cr2", ".nef", ".sr2", ".arw", ".dng"}
+# Part of every cache key; bump it when encoding changes so old outputs are not reused
+VERSION = 1
+
+JPEG_OFFSET = 0x0201
+JPEG_LENGTH = 0x0202
+STRIP_OFFSETS = 0x0111
+STRIP_COUNTS = 0x0117
+COMPRESSION = 0x0103
+SUB_IFDS = 0x014A
+
+def preview(path):
+    """
+    Largest JPEG embedded in a TIFF based raw file, found through every IFD and SubIFD, or None
+    """
+    with open(path, "rb") as f:
+        head = f.read(8)
+        if head[:4] not in (b"II*\0", b"MM\0*"):
+            return None
+        end = "<" if head[:2] == b"II" else ">"
+        found = []
+        todo, seen = [struct.unpack(end + "I", head[4:8])[0]], set()
+        while todo:
+            offset = todo.pop()
+            if not offset or offset in seen or len(seen) > 64: continue
+            seen.add(offset)
+            f.seek(offset)
+            count = struct.unpack(end + "H", f.read(2))[0]
+            data = f.read(count * 12 + 4)
+            tags = {}
+            for i in range(min(count, len(data) // 12)):
+                tag, kind, n, raw = struct.unpack(end + "HHI4s", data[i * 12:i * 12 + 12])
+                value = struct.unpack(end + "H", raw[:2])[0] if kind == 3 else struct.unpack(end + "I", raw)[0]
+                tags[tag] = (n, value)
+                if tag == SUB_IFDS:
+                    if n == 1:
+                        todo.append(value)
+                    else:
+                        here = f.tell()
+                        f.seek(value)
+                        todo.extend(struct.unpack(end + "I" * n, f.read(4 * n)))
+                        f.seek(here)
+            if len(data) >= count * 12 + 4:
+                todo.append(struct.unpack(end + "I", data[count * 12:count * 12 + 4])[0])
+            if JPEG_OFFSET in tags and JPEG_LENGTH in tags:
+                found.append((tags[JPEG_LENGTH][1], tags[JPEG_OFFSET][1]))
+            elif tags.get(COMPRESSION, (0, 0))[1] in (6, 7) and tags.get(STRIP_OFFSETS, (0,))[0] == 1 and STRIP_COUNTS in tags:
+                found.append((tags[STRIP_COUNTS][1], tags[STRIP_OFFSETS][1]))
+        for length, offset in sorted(found, reverse=True):
+            f.seek(offset)
+            data = f.read(length)
+            # Lossless raw data is also compression 7, only a baseline JPEG will do
+            if data[:3] == b"\xff\xd8\xff":
+                return data
+    return None
+
+def encode(source, target, fmt, quality):
+    """
+    Write source as fmt to target; raw files use their embedded preview
+    """
+    from PIL import Image, ImageOps
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+    data = preview(source) if os.path.splitext(source)[1].lower() in RAW else None
+    with Image.open(io.BytesIO(data) if data else source) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"): img = img.convert("RGB")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Two identical sources can be encoded at once, each into its own part file
+        part = f"{target}.{os.getpid()}.part"
+        img.save(part, fmt.upper(), quality=quality)
+    os.replace(part, target)
+
+def convert(read, digest, cache, fmt, quality, target, replace=False):
+    """
+    Runs in a worker process: hash read unless its digest is known, encode it into the cache
+    unless an earlier run already did, then place the cached output at target, replacing
+    the file there only when replace is set.
+    Returns (digest, reused, seconds spent encoding).
+    """
+    digest = digest or full_hash(read)
+    key = hashlib.blake2b(f"{digest}\0{fmt}\0{quality}\0{VERSION}".encode(), digest_size=16).hexdigest()
+    cached = os.path.join(cache, key[:2], key + FORMATS[fmt])
+    reused = os.path.exists(cached)
+    start = time.perf_counter()
+    if not reused:
+        encode(read, cached, fmt, quality)
+    seconds = time.perf_counter() - start
+    # A copy rather than a link, so editing the output can't change the cached one
+    part = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.part")
+    shutil.copyfile(cached, part)
+    try:
+        publish(part, target, replace)
+    except BaseException:
+        os.remove(part)
+        raise
+    return digest, reused, seconds
+
+def output(target, options):
+    """
+    Where the converted copy of an organized file goes: next to it, with the output format's suffix
+    """
+    return os.path.splitext(target)[0] + FORMATS[options["format"]]
+
+class Converter:
+    """
+    Converts organized files on a process pool, away from the copy threads.
+    Outputs are cached in <dest>/.filefusion/converted by source hash and parameters, and source
+    hashes are remembered by (path, size, mtime) in converted.db, so an unchanged file is never
+    read or encoded twice.
+    """
+    def __init__(self, dest, options, stats=None, workers=None):
+        folder = os.path.join(dest, STATE_DIR)
+        self.cache = os.path.join(folder, "converted")
+        os.makedirs(self.cache, exist_ok=True)
+        self.format = options["format"]
+        self.quality = options["quality"]
+        if self.format not in FORMATS:
+            raise ValueError(f"Unsupported conversion format '{self.format}', use one of {', '.join(FORMATS)}")
+        self.stats = stats
+        self.db = sqlite3.connect(os.path.join(folder, "converted.db"))
+        self.db.execute("""CREATE TABLE IF NOT EXISTS digests (
+            path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, digest TEXT NOT NULL)""")
+        self.known = {path: (size, mtime, digest) for path, size, mtime, digest in self.db.execute("SELECT * FROM digests")}
+        self.pool = ProcessPoolExecutor(workers or max(1, (os.cpu_count() or 2) - 1))
+        self.jobs = []
+
+    def submit(self, e, read, digest=None, replace=False):
+        """
+        Queue the conversion of plan entry e, reading the file at read.
+        replace lets it take over an older output of the same source.
+        """
+        known = self.known.get(os.path.abspath(e.source))
+        if known and known[:2] == (e.size, e.mtime): digest = known[2]
+        self.jobs.append((e, self.pool.submit(convert, read, digest, self.cache, self.format, self.quality, e.target,
+                                                      replace)))
+
+    def finish(self, cancel=False):
+        """
+        Wait for every queued conversion and remember the source hashes. Returns (converted, reused).
+        """
+        self.pool.shutdown(wait=True, cancel_futures=cancel)
+        rows = []
+        converted = reused = 0
+        for e, job in self.jobs:
+            if job.cancelled(): continue
+            try:
+                digest, hit, seconds = job.result()
+            except Exception as err:
+                print(f"Error converting file: '{e.source}': {err}")
+                continue
+            rows.append((os.path.abspath(e.source), e.size, e.mtime, digest))
+            converted += 1
+            reused += hit
+            if self.stats: self.stats.record("convert", seconds, 0 if hit else e.size)
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)", rows)
+        self.db.close()
+        return converted, reused
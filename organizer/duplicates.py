@@ -0,0 +1,100 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import time
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+PARTIAL = 4096
+CHUNK = 1048576
+
+def partial_hash(path, size):
+    """
+    Hash the first and last PARTIAL bytes, which covers the whole file when it is small
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(PARTIAL))
+        if size > PARTIAL:
+            f.seek(max(PARTIAL, size - PARTIAL))
+            h.update(f.read(PARTIAL))
+    return h.hexdigest()
+
+def hasher():
+    """
+    The content hash used for full hashes, manifests and the conversion cache
+    """
+    return hashlib.blake2b(digest_size=32)
+
+def full_hash(path):
+    h = hasher()
+    buf = bytearray(CHUNK)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while n := f.readinto(buf):
+            h.update(view[:n])
+    return h.hexdigest()
+
+def _cached(hashes, stage, compute, stats=None):
+    """
+    Wrap a hash function so it reuses and fills hashes[path][stage]
+    """
+    def key(r):
+        entry = hashes.setdefault(r.path, [None, None])
+        if entry[stage] is None:
+            start = time.perf_counter()
+            entry[stage] = compute(r)
+            if stats: stats.record("hash", time.perf_counter() - start, min(r.size, 2 * PARTIAL) if stage == 0 else r.size)
+        return entry[stage]
+    return key
+
+def _split(pool, groups, key):
+    """
+    Hash every candidate in groups with key on the pool and regroup them by (old key, hash)
+    """
+    jobs = [(k, r, pool.submit(key, r)) for k, rs in groups.items() for r in rs]
+    out = defaultdict(list)
+    for k, r, job in jobs:
+        try:
+            out[(k, job.result())].append(r)
+        except OSError as e:
+            print(f"Error hashing file: '{r.path}': {e}")
+    return {k: rs for k, rs in out.items() if len(rs) > 1}
+
+def find_duplicates(records, workers=4, hashes=None, stats=None):
+    """
+    Group identical files, hashing as little as possible:
+    size buckets, then a partial hash, then a full hash only for files that still collide.
+    Groups keep the order of records, so the first entry of each group is the one to keep.
+    hashes maps path to [partial, full]; known values are reused and new ones are added to it.
+    Empty files are never duplicates, they are placeholders whose name is all that matters.
+    """
+    hashes = {} if hashes is None else hashes
+    order = {r.path: i for i, r in enumerate(records)}
+    sizes = defaultdict(list)
+    for r in records:
+        if r.size: sizes[r.size].append(r)
+    groups = {s: rs for s, rs in sizes.items() if len(rs) > 1}
+
+    with ThreadPoolExecutor(workers) as pool:
+        groups = _split(pool, groups, _cached(hashes, 0, lambda r: partial_hash(r.path, r.size), stats))
+        small = {k: rs for k, rs in groups.items() if k[0] <= 2 * PARTIAL}
+        large = {k: rs for k, rs in groups.items() if k[0] > 2 * PARTIAL}
+        groups = list(small.values()) + list(_split(pool, large, _cached(hashes, 1, lambda r: full_hash(r.path), stats)).values())
+
+    groups = [sorted(rs, key=lambda r: order[r.path]) for rs in groups]
+    return sorted(groups, key=lambda rs: order[rs[0].path])
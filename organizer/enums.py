@@ -14,31 +14,109 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
 import json
+import time
+import threading
 from enum import Enum
+from organizer.classify import compile_types
+
+PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "settings.json")
 
 class Settings:
+    """
+    Process wide view of settings.json. Every instance shares one parsed copy,
+    which is re-read only when the file's mtime changes (checked at most once per CHECK seconds).
+    """
+    CHECK = 1.0
+
+    __data = None
+    __views = {}
+    __mtime = None
+    __checked = 0.0
+    __lock = threading.RLock()
+
     def __load_enums(self):
         """
         Load Settings File
         """
-        with open("../settings.json", "r") as f:
-            enums: dict = json.load(f)
-        return enums
-    
+        with Settings.__lock:
+            now = time.monotonic()
+            if Settings.__data is not None and now - Settings.__checked < self.CHECK:
+                return Settings.__data
+            Settings.__checked = now
+            mtime = os.stat(PATH).st_mtime_ns
+            if mtime != Settings.__mtime:
+                with open(PATH, "r") as f:
+                    Settings.__data = json.load(f)
+                Settings.__mtime = mtime
+                Settings.__views = {}
+            return Settings.__data
+
+    def __view(self, name, build):
+        """
+        Value derived from the settings, rebuilt only after the file changes
+        """
+        data = self.__load_enums()
+        with Settings.__lock:
+            if name not in Settings.__views:
+                Settings.__views[name] = build(data)
+            return Settings.__views[name]
+
     def get_theme(self):
-        tmp = self.__load_enums()
-        current_gui = tmp["_settings"]["_gui"]["cur"]
-        return tmp["_settings"]["_gui"][current_gui]
-    
+        return self.__view("theme", lambda d: d["_settings"]["_gui"][d["_settings"]["_gui"]["cur"]])
+
+    def get_types(self):
+        """
+        Compiled (suffix -> category, preset -> suffixes) lookups for the TYPE rule
+        """
+        return self.__view("types", lambda d: compile_types(d["types"], d["_presets"]))
+
+    def get_presets(self):
+        return self.get_types()[1]
+
+    def get_convert(self):
+        """
+        Output format, quality and source suffixes of the conversion stage
+        """
+        def build(d):
+            options = {"format": "jpeg", "quality": 85, "from": []}
+            options.update(d["_settings"].get("_convert", {}))
+            options["from"] = frozenset(s.lower() for s in options["from"])
+            return options
+        return self.__view("convert", build)
+
+    def get_size(self):
+        """
+        Bucket mode, adaptive bucket count and fixed buckets of the SIZE rule
+        """
+        def build(d):
+            options = {"mode": "adaptive", "buckets": 4, "fixed": {"small": "1M", "medium": "100M", "large": "1G"},
+                       "largest": "huge"}
+            options.update(d["_settings"].get("_size", {}))
+            return options
+        return self.__view("size", build)
+
     def set_theme(self, theme):
-        with open('settings.json', 'r') as f:
-            data = json.load(f)
+        self.update(lambda data: data["_settings"]["_gui"].__setitem__("cur", theme))
 
-        data['_settings']['_gui']['cur'] = theme
-        
-        with open('settings.json', 'w') as f:
-            json.dump(data, f, indent=4)
+    def update(self, change):
+        """
+        Apply change to a copy of the settings and save it atomically
+        """
+        with Settings.__lock:
+            data = json.loads(json.dumps(self.__load_enums()))
+            change(data)
+            tmp = PATH + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, PATH)
+            Settings.__data = data
+            Settings.__mtime = os.stat(PATH).st_mtime_ns
+            Settings.__checked = time.monotonic()
+            Settings.__views = {}
 
 class enum(Enum):
     DATE = "date"
@@ -48,6 +126,18 @@ class enum(Enum):
     @classmethod
     def __custom():
         pass
+
+class Policy(Enum):
+    SKIP = "skip"
+    LINK = "link"
+    REPORT = "report"
+
+class Strategy(Enum):
+    COPY = "copy"
+    MOVE = "move"
+    HARDLINK = "hardlink"
+    REFLINK = "reflink"
+    AUTO = "auto"
     
 if __name__ == '__main__':
     pass
\ No newline at end of file
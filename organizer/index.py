@@ -0,0 +1,137 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sqlite3
+from urllib.parse import quote
+from organizer.scanner import FileRecord
+
+STATE_DIR = ".filefusion"
+
+def connect(dest, name, schema, read_only=False):
+    """
+    Open the database <dest>/.filefusion/<name>, creating its tables from schema.
+    Read only, nothing in dest is created or changed: an existing database is opened read only
+    and a missing one is an empty one in memory.
+    """
+    path = os.path.join(dest, STATE_DIR, name)
+    if read_only and os.path.exists(path):
+        # Immutable, as even a read only connection to a WAL database leaves -wal and -shm files behind
+        return sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro&immutable=1", uri=True)
+    if read_only:
+        db = sqlite3.connect(":memory:")
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(schema)
+    return db
+
+class Index:
+    """
+    On-disk record of what earlier runs organized, kept in <dest>/.filefusion/index.db.
+    read_only is for dry runs, which look things up but never write.
+    """
+    def __init__(self, dest, read_only=False):
+        self.db = connect(dest, "index.db", """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                inode INTEGER NOT NULL,
+                partial TEXT,
+                hash TEXT,
+                dest TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_size ON files(size);
+            CREATE INDEX IF NOT EXISTS files_dest ON files(dest);
+        """, read_only)
+
+    def known(self, source):
+        """
+        Metadata of every organized file under source, as {path: (size, mtime, inode)}
+        """
+        prefix = os.path.join(os.path.abspath(source), "")
+        rows = self.db.execute(
+            "SELECT path, size, mtime, inode FROM files WHERE dest IS NOT NULL AND path >= ? AND path < ?",
+            (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+        return {path: (size, mtime, inode) for path, size, mtime, inode in rows}
+
+    @staticmethod
+    def unchanged(known, record):
+        return known.get(os.path.abspath(record.path)) == (record.size, record.mtime, record.inode)
+
+    def organized(self, sizes, hashes):
+        """
+        Records for files already in the destination with one of the given sizes.
+        Their stored hashes are copied into hashes, keyed by destination path.
+        """
+        out = []
+        for size in sizes:
+            for dest, partial, full in self.db.execute(
+                    "SELECT dest, partial, hash FROM files WHERE size = ? AND dest IS NOT NULL", (size,)):
+                # Skipped duplicates share their original's destination
+                if dest in hashes: continue
+                out.append(FileRecord(dest, size, 0.0, 0, 0))
+                hashes[dest] = [partial, full]
+        return out
+
+    def made(self, path, dest):
+        """
+        Whether an earlier run organized the file at path into dest
+        """
+        return self.db.execute("SELECT 1 FROM files WHERE dest = ? AND path = ?",
+                               (dest, os.path.abspath(path))).fetchone() is not None
+
+    def digests(self):
+        """
+        (size, mtime, content hash) of every organized file that has a hash, keyed by its absolute
+        destination path. Size and mtime are the ones it was organized with, copies keep both.
+        """
+        rows = self.db.execute("SELECT dest, size, mtime, hash FROM files WHERE dest IS NOT NULL AND hash IS NOT NULL")
+        return {dest: (size, mtime, digest) for dest, size, mtime, digest in rows}
+
+    def add(self, rows):
+        """
+        Bulk insert (plan entry, partial, hash) rows in one transaction
+        """
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime, inode, partial, hash, dest) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(os.path.abspath(e.source), e.size, e.mtime, e.inode, partial, full, e.target)
+                 for e, partial, full in rows])
+
+    def update_hashes(self, hashes):
+        with self.db:
+            self.db.executemany(
+                "UPDATE files SET partial = COALESCE(?, partial), hash = COALESCE(?, hash) WHERE dest = ?",
+                [(partial, full, dest) for dest, (partial, full) in hashes.items()])
+
+    def compact(self):
+        """
+        Drop entries whose destination file is gone, then shrink the database and its WAL
+        """
+        gone = [(dest,) for dest, in self.db.execute("SELECT dest FROM files WHERE dest IS NOT NULL")
+                if not os.path.exists(dest)]
+        with self.db:
+            self.db.executemany("DELETE FROM files WHERE dest = ?", gone)
+        self.db.execute("VACUUM")
+        self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return len(gone)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,139 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import time
+import queue
+import threading
+from collections import namedtuple
+from organizer import FileOrganizer
+
+Progress = namedtuple("Progress", ["phase", "files", "total_files", "bytes", "total_bytes", "eta", "current"])
+
+class Cancelled(KeyboardInterrupt):
+    """
+    Raised inside the organizer when its job is cancelled; handled like Ctrl+C so the run can be resumed
+    """
+
+class Job:
+    """
+    Runs a FileOrganizer on a background thread.
+    Progress goes to a queue at most once per INTERVAL seconds, however many files go by,
+    so a reader polling at its own frame rate never falls behind.
+    """
+    INTERVAL = 0.05
+
+    def __init__(self, source, dest, ext, **options):
+        self.events = queue.Queue()
+        self.error = None
+        self.__args = (source, dest, ext)
+        self.__options = options
+        self.__running = threading.Event()
+        self.__running.set()
+        self.__cancelled = threading.Event()
+        self.__lock = threading.Lock()
+        self.__phase = "scan"
+        self.__files = self.__bytes = 0
+        self.__total_files = self.__total_bytes = 0
+        self.__started = time.monotonic()
+        self.__posted = 0.0
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+
+    def __run(self):
+        try:
+            FileOrganizer(*self.__args, job=self, **self.__options)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            # Keep the last counts on screen, only the phase changes
+            with self.__lock:
+                self.__phase = "cancelled" if self.__cancelled.is_set() else "error" if self.error else "done"
+            self.__post(None, True)
+
+    def start(self):
+        self.thread.start()
+
+    def pause(self):
+        self.__running.clear()
+
+    def resume(self):
+        self.__running.set()
+
+    def cancel(self):
+        self.__cancelled.set()
+        self.__running.set()
+
+    @property
+    def paused(self):
+        return not self.__running.is_set()
+
+    def alive(self):
+        return self.thread.is_alive()
+
+    def checkpoint(self):
+        """
+        Called by the organizer between files: blocks while paused, raises once cancelled
+        """
+        self.__running.wait()
+        if self.__cancelled.is_set():
+            raise Cancelled()
+
+    def phase(self, name, total_files=0, total_bytes=0):
+        with self.__lock:
+            self.__phase = name
+            self.__files = self.__bytes = 0
+            self.__total_files, self.__total_bytes = total_files, total_bytes
+            self.__started = time.monotonic()
+        self.__post(None, True)
+
+    def extend(self, total_files, total_bytes):
+        """
+        Grow the totals of the current phase by work found while it already runs
+        """
+        with self.__lock:
+            self.__total_files += total_files
+            self.__total_bytes += total_bytes
+
+    def advance(self, size, current=None):
+        with self.__lock:
+            self.__files += 1
+            self.__bytes += size
+        self.__post(current)
+
+    def __post(self, current, force=False):
+        now = time.monotonic()
+        if not force and now - self.__posted < self.INTERVAL:
+            return
+        self.__posted = now
+        with self.__lock:
+            elapsed = now - self.__started
+            eta = None
+            if self.__bytes and self.__total_bytes:
+                eta = elapsed * (self.__total_bytes - self.__bytes) / self.__bytes
+            self.events.put(Progress(self.__phase, self.__files, self.__total_files,
+                                     self.__bytes, self.__total_bytes, eta, current))
+
+    def latest(self):
+        """
+        Drain the queue and return only the newest progress, or None if nothing new arrived
+        """
+        last = None
+        try:
+            while True:
+                last = self.events.get_nowait()
+        except queue.Empty:
+            return last
@@ -0,0 +1,88 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+import threading
+from organizer.index import STATE_DIR
+
+class Journal:
+    """
+    Append-only log of planned and finished transfers in <dest>/.filefusion/journal.jsonl.
+    Plans are synced to disk before their transfers start, finished entries are written in batches.
+    """
+    BATCH = 256
+
+    def __init__(self, dest, resume=False):
+        folder = os.path.join(dest, STATE_DIR)
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, "journal.jsonl")
+        self.finished, self.planned = self.__load() if resume else ({}, {})
+        self.file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        self.__done = []
+        self.__lock = threading.Lock()
+
+    def __load(self):
+        """
+        Map each finished source path to (target, size, mtime) from an earlier run,
+        and each planned source path to its target
+        """
+        finished, planned = {}, {}
+        if not os.path.exists(self.path):
+            return finished, planned
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Torn last line from a crash
+                if entry["op"] == "done":
+                    finished[entry["src"]] = (entry["dst"], entry["size"], entry["mtime"])
+                elif entry["op"] == "plan":
+                    planned[entry["src"]] = entry["dst"]
+        return finished, planned
+
+    def is_finished(self, e):
+        return self.finished.get(os.path.abspath(e.source)) == (e.target, e.size, e.mtime)
+
+    def __write(self, entries, sync):
+        self.file.write("".join(json.dumps(e) + "\n" for e in entries))
+        self.file.flush()
+        if sync: os.fsync(self.file.fileno())
+
+    def plan(self, batch):
+        with self.__lock:
+            self.__write([{"op": "plan", "src": os.path.abspath(e.source), "dst": e.target, "size": e.size, "mtime": e.mtime}
+                          for e in batch], True)
+
+    def done(self, e):
+        with self.__lock:
+            self.__done.append({"op": "done", "src": os.path.abspath(e.source), "dst": e.target, "size": e.size,
+                                "mtime": e.mtime})
+            if len(self.__done) >= self.BATCH:
+                self.__write(self.__done, False)
+                self.__done = []
+
+    def close(self, complete=False):
+        """
+        Flush what is left; a complete run has nothing to resume so its journal is removed
+        """
+        with self.__lock:
+            self.__write(self.__done, False)
+            self.__done = []
+            self.file.close()
+        if complete:
+            os.remove(self.path)
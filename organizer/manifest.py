@@ -0,0 +1,112 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+import random
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from organizer.index import STATE_DIR
+from organizer.duplicates import full_hash
+
+# One per destination folder, listing what was organized into it
+MANIFEST = ".manifest.jsonl"
+
+Row = namedtuple("Row", ["name", "size", "hash", "mtime"])
+
+def read(folder):
+    """
+    Map each file name in folder's manifest to its Row, empty when there is none
+    """
+    rows = {}
+    path = os.path.join(folder, MANIFEST)
+    if not os.path.exists(path):
+        return rows
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = Row(**json.loads(line))
+            except (ValueError, TypeError):
+                continue
+            rows[row.name] = row
+    return rows
+
+def update(folder, rows):
+    """
+    Merge rows into folder's manifest; a file organized again replaces its old row.
+    Written to a temporary file first so an interrupted run leaves the old manifest intact.
+    """
+    merged = read(folder)
+    merged.update((r.name, r) for r in rows)
+    path = os.path.join(folder, MANIFEST)
+    part = path + ".part"
+    with open(part, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r._asdict()) + "\n" for r in sorted(merged.values())))
+    os.replace(part, path)
+
+def write(entries):
+    """
+    Update the manifest of every folder the rows in entries ({target path: Row}) went to
+    """
+    folders = {}
+    for target, row in entries.items():
+        folders.setdefault(os.path.dirname(target), []).append(row)
+    for folder, rows in folders.items():
+        try:
+            update(folder, rows)
+        except OSError as e:
+            print(f"Error writing manifest: '{folder}': {e}")
+
+def manifests(library):
+    for folder, dirs, files in os.walk(library):
+        dirs[:] = [d for d in dirs if d != STATE_DIR]
+        if MANIFEST in files:
+            yield folder
+
+def check(path, row):
+    """
+    What is wrong with path compared to its manifest row, None when nothing is
+    """
+    try:
+        if os.path.getsize(path) != row.size:
+            return "size changed"
+        # Files placed by link or rename were not read, so only their size was recorded
+        if row.hash and full_hash(path) != row.hash:
+            return "content changed"
+    except FileNotFoundError:
+        return "missing"
+    except OSError as e:
+        return str(e)
+    return None
+
+def verify(library, workers=4, sample=None, seed=None):
+    """
+    Check the files of every manifest under library against their recorded size and hash,
+    on a thread pool since hashing is mostly waiting on the disk.
+    sample checks only that fraction of the files, picked at random.
+    Returns [(path, problem)].
+    """
+    todo = [(os.path.join(folder, name), row) for folder in manifests(library) for name, row in read(folder).items()]
+    if sample is not None and sample < 1:
+        count = min(len(todo), max(1, round(len(todo) * sample))) if todo else 0
+        todo = random.Random(seed).sample(todo, count)
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        found = pool.map(lambda item: (item[0], check(*item)), todo)
+        problems = [(path, problem) for path, problem in found if problem]
+    print(f"Verified {len(todo)} files, {len(problems)} problems")
+    for path, problem in problems:
+        print(f"    {path}: {problem}")
+    return problems
@@ -0,0 +1,212 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import struct
+from datetime import datetime
+from organizer.index import connect
+
+# Formats from settings.json "photos" and "videos" whose headers carry a capture date
+SUFFIXES = {".jpg", ".jpeg", ".heic", ".heif", ".tif", ".tiff", ".cr2", ".nef", ".orf", ".sr2", ".arw", ".dng",
+            ".mp4", ".mov", ".m4v", ".3gp", ".3g2"}
+MAX_READ = 65536
+EPOCH_1904 = 2082844800
+
+DATETIME_ORIGINAL = 0x9003
+DATETIME_DIGITIZED = 0x9004
+DATETIME = 0x0132
+EXIF_IFD = 0x8769
+
+def _read(f, offset, size):
+    f.seek(offset)
+    return f.read(min(size, MAX_READ))
+
+def _exif_time(value):
+    try:
+        return datetime.strptime(value.rstrip(b"\0 ").decode("ascii"), "%Y:%m:%d %H:%M:%S").timestamp()
+    except (ValueError, UnicodeDecodeError, OverflowError, OSError):
+        return None
+
+def _tiff(f, base):
+    """
+    Capture time from a TIFF structure starting at base, following only IFD0 and the Exif IFD
+    """
+    head = _read(f, base, 8)
+    if head[:4] not in (b"II*\0", b"MM\0*"):
+        return None
+    end = "<" if head[:2] == b"II" else ">"
+
+    def entries(offset):
+        count = struct.unpack(end + "H", _read(f, base + offset, 2))[0]
+        data = _read(f, base + offset + 2, count * 12)
+        for i in range(len(data) // 12):
+            yield struct.unpack(end + "HHII", data[i * 12:i * 12 + 12])
+
+    found = {}
+    exif = None
+    for tag, kind, count, value in entries(struct.unpack(end + "I", head[4:8])[0]):
+        if tag == EXIF_IFD: exif = value
+        if tag == DATETIME and kind == 2: found[tag] = value
+    if exif:
+        for tag, kind, count, value in entries(exif):
+            if tag in (DATETIME_ORIGINAL, DATETIME_DIGITIZED) and kind == 2: found[tag] = value
+
+    for tag in (DATETIME_ORIGINAL, DATETIME_DIGITIZED, DATETIME):
+        if tag in found:
+            taken = _exif_time(_read(f, base + found[tag], 20))
+            if taken: return taken
+    return None
+
+def _jpeg(f):
+    """
+    Walk JPEG segment headers up to the start of scan looking for the Exif APP1 block
+    """
+    offset = 2
+    while True:
+        marker = _read(f, offset, 4)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] == 0xDA:
+            return None
+        length = struct.unpack(">H", marker[2:])[0]
+        if marker[1] == 0xE1 and _read(f, offset + 4, 6) == b"Exif\0\0":
+            return _tiff(f, offset + 10)
+        offset += 2 + length
+
+def _boxes(f, start, end):
+    """
+    Yield (type, payload offset, payload end) for ISO BMFF boxes between start and end
+    """
+    offset = start
+    while offset + 8 <= end:
+        head = _read(f, offset, 16)
+        if len(head) < 8: return
+        size, kind = struct.unpack(">I4s", head[:8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", head[8:16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header: return
+        yield kind, offset + header, min(offset + size, end)
+        offset += size
+
+def _uint(data, pos, size):
+    return int.from_bytes(data[pos:pos + size], "big") if size else 0, pos + size
+
+def _heif_exif(f, start, end):
+    """
+    Find the Exif item of a HEIF meta box through iinf and iloc, then parse its TIFF block
+    """
+    exif_id = None
+    locations = {}
+    for kind, pos, stop in _boxes(f, start + 4, end):
+        if kind not in (b"iinf", b"iloc"): continue
+        data = _read(f, pos, stop - pos)
+        version = data[0]
+        if kind == b"iinf":
+            count_size = 2 if version == 0 else 4
+            for infe, ipos, istop in _boxes(f, pos + 4 + count_size, stop):
+                entry = _read(f, ipos, 16)
+                if infe == b"infe" and entry[0] >= 2:
+                    id_size = 2 if entry[0] == 2 else 4
+                    item = int.from_bytes(entry[4:4 + id_size], "big")
+                    if entry[6 + id_size:10 + id_size] == b"Exif": exif_id = item
+        elif kind == b"iloc":
+            offset_size, length_size = data[4] >> 4, data[4] & 15
+            base_size, index_size = data[5] >> 4, (data[5] & 15 if version else 0)
+            p = 6
+            count, p = _uint(data, p, 2 if version < 2 else 4)
+            for _ in range(count):
+                item, p = _uint(data, p, 2 if version < 2 else 4)
+                if version: p += 2
+                p += 2
+                base, p = _uint(data, p, base_size)
+                extents, p = _uint(data, p, 2)
+                for n in range(extents):
+                    p += index_size
+                    offset, p = _uint(data, p, offset_size)
+                    length, p = _uint(data, p, length_size)
+                    if n == 0: locations[item] = base + offset
+    if exif_id not in locations:
+        return None
+    # The item starts with the offset from its own data to the TIFF header
+    skip = struct.unpack(">I", _read(f, locations[exif_id], 4))[0]
+    return _tiff(f, locations[exif_id] + 4 + skip)
+
+def _bmff(f, size):
+    """
+    QuickTime/MP4 creation time from moov/mvhd, or HEIF Exif from meta
+    """
+    for kind, pos, end in _boxes(f, 0, size):
+        if kind == b"meta":
+            return _heif_exif(f, pos, end)
+        if kind == b"moov":
+            for inner, ipos, _ in _boxes(f, pos, end):
+                if inner == b"mvhd":
+                    data = _read(f, ipos, 12)
+                    created = struct.unpack(">Q", data[4:12])[0] if data[0] == 1 else struct.unpack(">I", data[4:8])[0]
+                    return created - EPOCH_1904 if created > EPOCH_1904 else None
+            return None
+    return None
+
+def capture_time(path, size):
+    """
+    Capture time of a photo or video as a timestamp, reading only headers, or None
+    """
+    if os.path.splitext(path)[1].lower() not in SUFFIXES:
+        return None
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(12)
+            if magic[:2] == b"\xff\xd8":
+                return _jpeg(f)
+            if magic[:4] in (b"II*\0", b"MM\0*"):
+                return _tiff(f, 0)
+            if magic[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"):
+                return _bmff(f, size)
+    except (OSError, struct.error, IndexError, ValueError):
+        pass
+    return None
+
+class MetadataCache:
+    """
+    Capture times from earlier runs, keyed by (absolute path, size, mtime), in <dest>/.filefusion/metadata.db.
+    Read only, earlier times are used but new ones are not kept.
+    """
+    def __init__(self, dest, read_only=False):
+        self.read_only = read_only
+        self.db = connect(dest, "metadata.db", """CREATE TABLE IF NOT EXISTS taken (
+            path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, time REAL)""", read_only)
+
+    def get(self, records):
+        """
+        Map path to cached capture time (possibly None) for every record still matching its entry
+        """
+        found = {}
+        for r in records:
+            row = self.db.execute("SELECT size, mtime, time FROM taken WHERE path = ?", (os.path.abspath(r.path),)).fetchone()
+            if row and row[0] == r.size and row[1] == r.mtime:
+                found[r.path] = row[2]
+        return found
+
+    def put(self, rows):
+        if self.read_only: return
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO taken VALUES (?, ?, ?, ?)",
+                                [(os.path.abspath(r.path), r.size, r.mtime, t) for r, t in rows])
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,58 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+from collections import namedtuple, Counter
+from organizer.enums import Policy
+from organizer.stats import human
+
+# strategy is a Strategy value, Policy.LINK/Policy.SKIP for duplicates or CONVERT for a converted copy;
+# via is the file a link points at, or the organized file a conversion reads
+CONVERT = "convert"
+PlanEntry = namedtuple("PlanEntry", ["source", "target", "size", "mtime", "inode", "device", "strategy", "via"])
+
+def entry(record, target, strategy, via=None):
+    return PlanEntry(record.path, target, record.size, record.mtime, record.inode, record.device, strategy, via)
+
+def directories(plan):
+    """
+    Every distinct destination folder, parents first
+    """
+    return sorted({os.path.dirname(e.target) for e in plan if e.strategy != Policy.SKIP.value})
+
+def locality(e):
+    """
+    Sort key that keeps files from the same disk together, in inode order
+    which roughly follows their layout on disk
+    """
+    return (e.device, e.inode, e.source)
+
+def write_plan(path, plan):
+    with open(path, "w", encoding="utf-8") as f:
+        for e in plan:
+            f.write(json.dumps(e._asdict()) + "\n")
+
+def read_plan(path):
+    with open(path, encoding="utf-8") as f:
+        return [PlanEntry(**json.loads(line)) for line in f if line.strip()]
+
+def summary(plan):
+    counts = Counter(e.strategy for e in plan)
+    size = sum(e.size for e in plan if e.strategy not in (Policy.SKIP.value, CONVERT))
+    lines = [f"Planned {len(plan)} files ({human(size)}) into {len(directories(plan))} folders"]
+    lines += [f"    {strategy}: {n}" for strategy, n in sorted(counts.items())]
+    return "\n".join(lines)
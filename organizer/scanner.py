@@ -0,0 +1,134 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import stat
+import queue
+import threading
+from collections import namedtuple
+
+FileRecord = namedtuple("FileRecord", ["path", "size", "mtime", "inode", "device"])
+
+SYSTEM_DIRS = {"$RECYCLE.BIN", "System Volume Information", "lost+found", "@eaDir", "__MACOSX"}
+_HIDDEN = getattr(stat, "FILE_ATTRIBUTE_HIDDEN", 0x2) | getattr(stat, "FILE_ATTRIBUTE_SYSTEM", 0x4)
+
+def is_hidden(entry):
+    if entry.name.startswith(".") or entry.name in SYSTEM_DIRS:
+        return True
+    # st_file_attributes only exists on Windows, where scandir fills it in without a syscall
+    attrs = getattr(entry.stat(follow_symlinks=False), "st_file_attributes", 0)
+    return bool(attrs & _HIDDEN)
+
+def scan(source, skip_hidden=False, exclude=()):
+    """
+    Walk source with os.scandir and yield one FileRecord per file, statting each entry once.
+    Folders in exclude (absolute paths), such as a destination inside the source, are not entered,
+    and .<name>.part files of transfers in flight are left out.
+    """
+    stack = [source]
+    while stack:
+        root = stack.pop()
+        try:
+            with os.scandir(root) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"Error scanning folder '{root}': {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if skip_hidden and is_hidden(entry):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if not exclude or os.path.abspath(entry.path) not in exclude:
+                        subdirs.append(entry.path)
+                elif entry.name.startswith(".") and entry.name.endswith(".part"):
+                    continue
+                elif entry.is_file():
+                    st = entry.stat()
+                    yield FileRecord(entry.path, st.st_size, st.st_mtime, st.st_ino, st.st_dev)
+            except OSError as e:
+                print(f"Error scanning file '{entry.path}': {e}")
+        # Reversed so the stack pops subfolders in name order, same as os.walk
+        stack.extend(reversed(subdirs))
+
+def scan_sources(sources, skip_hidden=False, maxsize=1024, walk=scan, exclude=()):
+    """
+    Scan every source root on its own thread into one bounded queue and yield (root index, FileRecord)
+    as they arrive; each root still comes out in scan order. Records of a fast device don't wait for
+    a slow one, but the queue only bounds how far the scanners run ahead of the consumer, not how many
+    records the consumer keeps. walk(source, skip_hidden, exclude) lists one source, and an error it raises
+    is raised here rather than ending that source's records early.
+    """
+    merged = queue.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Wakes up now and then so a scanner can't stay blocked on a consumer that went away
+        while not stop.is_set():
+            try:
+                merged.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker(i, source):
+        try:
+            for record in walk(source, skip_hidden, exclude):
+                if not put((i, record)): return
+        except BaseException as e:
+            put((None, e))
+        finally:
+            put(done)
+
+    threads = [threading.Thread(target=worker, args=(i, s), daemon=True) for i, s in enumerate(sources)]
+    for t in threads: t.start()
+    try:
+        running = len(threads)
+        while running:
+            item = merged.get()
+            if item is done: running -= 1
+            elif item[0] is None: raise item[1]
+            else: yield item
+    finally:
+        stop.set()
+
+def stat_files(paths):
+    """
+    FileRecords for an explicit list of files, such as the ones a watch just saw arrive
+    """
+    for path in paths:
+        try:
+            st = os.stat(path)
+            yield FileRecord(path, st.st_size, st.st_mtime, st.st_ino, st.st_dev)
+        except OSError as e:
+            print(f"Error scanning file '{path}': {e}")
+
+def batches(records, size=256):
+    """
+    Group a stream of records into lists of at most size
+    """
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,131 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from organizer.scanner import batches
+
+# Formats Pillow decodes out of the box
+SUFFIXES = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp"}
+# Largest Hamming distance between two 64-bit hashes still counted as the same picture
+DISTANCE = 8
+SIDE = 32
+
+def _dct(n):
+    import numpy as np
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m.astype(np.float32)
+
+def perceptual(paths, kind="phash"):
+    """
+    64-bit perceptual hashes of a batch of images, None where a file can't be decoded.
+    Runs in a worker process: every image is decoded small, then the whole batch is hashed at once.
+    pHash keeps the signs of the lowest DCT frequencies of a 32x32 grey image against their median,
+    dHash compares neighbouring pixels of a 9x8 one.
+    """
+    import numpy as np
+    from PIL import Image, ImageOps
+    size = (SIDE, SIDE) if kind == "phash" else (9, 8)
+    pixels = np.zeros((len(paths), size[1], size[0]), dtype=np.float32)
+    decoded = np.zeros(len(paths), dtype=bool)
+    for i, path in enumerate(paths):
+        try:
+            with Image.open(path) as img:
+                # JPEGs decode at 1/8 scale when that is still larger than needed
+                img.draft("L", (size[0] * 4, size[1] * 4))
+                img = ImageOps.exif_transpose(img).convert("L").resize(size, Image.Resampling.BOX)
+                pixels[i] = np.asarray(img, dtype=np.float32)
+                decoded[i] = True
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+            pass
+
+    if kind == "phash":
+        dct = _dct(SIDE)
+        low = (dct @ pixels @ dct.T)[:, :8, :8].reshape(len(paths), 64)
+        bits = low > np.median(low[:, 1:], axis=1)[:, None]
+    else:
+        bits = (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(paths), 64)
+    packed = np.packbits(bits, axis=1)
+    return [int.from_bytes(row.tobytes(), "big") if ok else None for row, ok in zip(packed, decoded)]
+
+class MultiIndex:
+    """
+    Multi-index hashing over Hamming distance. Hashes are split into BLOCKS blocks of 16 bits,
+    each with its own table. Two hashes within radius differ by at most radius // BLOCKS bits in
+    at least one block, so a lookup only probes the few table keys that close to each block
+    of the query and checks the hashes found there, instead of comparing against every hash.
+    """
+    BLOCKS = 4
+    BITS = 16
+
+    def __init__(self, radius):
+        self.radius = radius
+        near = radius // self.BLOCKS
+        self.masks = [m for m in range(1 << self.BITS) if m.bit_count() <= near]
+        self.tables = [{} for _ in range(self.BLOCKS)]
+        self.values = []
+        self.items = []
+
+    def __blocks(self, value):
+        return [(value >> (i * self.BITS)) & ((1 << self.BITS) - 1) for i in range(self.BLOCKS)]
+
+    def add(self, value, item):
+        n = len(self.values)
+        self.values.append(value)
+        self.items.append(item)
+        for table, block in zip(self.tables, self.__blocks(value)):
+            table.setdefault(block, []).append(n)
+
+    def nearest(self, value):
+        """
+        (distance, item) of the closest hash within radius, the earliest added on ties, or None
+        """
+        seen = set()
+        for table, block in zip(self.tables, self.__blocks(value)):
+            for found in [table[k] for k in [block ^ mask for mask in self.masks] if k in table]:
+                seen.update(found)
+        best = None
+        for n in sorted(seen):
+            d = (value ^ self.values[n]).bit_count()
+            if d <= self.radius and (best is None or d < best[0]):
+                best = (d, self.items[n])
+        return best
+
+def find_similar(records, workers=4, distance=DISTANCE, kind="phash", stats=None):
+    """
+    Group photos that look the same, such as a re-export or a re-compressed copy.
+    The first record of each group in the order given is its original; every other
+    record joins the original closest to it within distance.
+    """
+    records = [r for r in records if os.path.splitext(r.path)[1].lower() in SUFFIXES]
+    groups = {}
+    index = MultiIndex(distance)
+    with ProcessPoolExecutor(workers) as pool:
+        chunks = list(batches(records, 256))
+        for chunk, found in zip(chunks, pool.map(perceptual, [[r.path for r in c] for c in chunks], [kind] * len(chunks))):
+            if stats: stats.count("similar", len(chunk), sum(r.size for r in chunk))
+            for record, value in zip(chunk, found):
+                if value is None: continue
+                match = index.nearest(value)
+                if match is None:
+                    index.add(value, record)
+                    groups[record.path] = [record]
+                else:
+                    groups[match[1].path].append(record)
+    return [group for group in groups.values() if len(group) > 1]
@@ -0,0 +1,136 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+import math
+import bisect
+from organizer.index import STATE_DIR
+from organizer.stats import parse_size
+
+# Fewer files than this say too little about a library to size its buckets from
+MIN_SAMPLES = 100
+STEPS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+UNITS = ["B", "KiB", "MiB", "GiB", "TiB"]
+
+class SizeSketch:
+    """
+    Streaming quantiles of file sizes in logarithmic bins, each GAMMA times wider than the last.
+    Memory is a few hundred counters however many files go by, and any quantile is
+    within 1% of the true size.
+    """
+    GAMMA = 1.02
+
+    def __init__(self):
+        self.bins = {}
+        self.count = 0
+        self.__log = math.log(self.GAMMA)
+
+    def add(self, size):
+        i = math.ceil(math.log(size) / self.__log) if size > 1 else 0
+        self.bins[i] = self.bins.get(i, 0) + 1
+        self.count += 1
+
+    def quantile(self, q):
+        rank = q * (self.count - 1)
+        seen = 0
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                return 2 * self.GAMMA ** i / (self.GAMMA + 1) if i else 1
+        return 0
+
+def label(size):
+    unit = 0
+    while size >= 1024 and unit < len(UNITS) - 1:
+        size /= 1024
+        unit += 1
+    return f"{size:g} {UNITS[unit]}"
+
+def round_size(size):
+    """
+    Nearest 1-2-5 step of its unit, so adaptive boundaries read like 2 MiB instead of 1.87 MiB
+    """
+    unit = 1
+    while size >= 1024 * unit and unit < 1024 ** 4:
+        unit *= 1024
+    return unit * min(STEPS, key=lambda s: abs(math.log(s) - math.log(max(size / unit, 1e-9))))
+
+class SizeBuckets:
+    """
+    Upper bounds and folder names of the SIZE rule, with the last bucket open ended
+    """
+    def __init__(self, bounds, names):
+        self.bounds = bounds
+        self.names = names
+
+    def name(self, size):
+        return self.names[bisect.bisect_left(self.bounds, size)]
+
+    @classmethod
+    def fixed(cls, options):
+        pairs = [(parse_size(str(limit)), name) for name, limit in options["fixed"].items()]
+        pairs.sort()
+        return cls([b for b, _ in pairs], [n for _, n in pairs] + [options["largest"]])
+
+    @classmethod
+    def adaptive(cls, sketch, count):
+        """
+        count buckets holding about the same number of files, named by their rounded bounds
+        """
+        count = max(2, count)
+        bounds = sorted({round_size(sketch.quantile(i / count)) for i in range(1, count)})
+        names = [f"under {label(bounds[0])}"]
+        names += [f"{label(a)} to {label(b)}" for a, b in zip(bounds, bounds[1:])]
+        names += [f"over {label(bounds[-1])}"]
+        return cls(bounds, names)
+
+    @classmethod
+    def known(cls, dest, options):
+        """
+        The buckets for dest when they don't depend on the files of this run: fixed ones, or
+        adaptive ones an earlier run saved. None while adaptive buckets are still to be worked out.
+        """
+        if options["mode"] != "adaptive":
+            return cls.fixed(options)
+        try:
+            with open(os.path.join(dest, STATE_DIR, "sizes.json"), encoding="utf-8") as f:
+                saved = json.load(f)
+            return cls(saved["bounds"], saved["names"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def load(cls, dest, options, sketch, save=True):
+        """
+        The buckets for dest. In adaptive mode the first run that files anything decides them for good:
+        with enough files they are worked out from its sketch, with fewer the fixed buckets from
+        settings.json are used, and either way they are saved in <dest>/.filefusion/sizes.json so
+        later runs file into the same folders. Without save (a dry run) nothing is written.
+        """
+        buckets = cls.known(dest, options)
+        if buckets is not None:
+            return buckets
+        path = os.path.join(dest, STATE_DIR, "sizes.json")
+        if sketch.count < MIN_SAMPLES:
+            buckets = cls.fixed(options)
+        else:
+            buckets = cls.adaptive(sketch, options["buckets"])
+        if save and sketch.count:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"bounds": buckets.bounds, "names": buckets.names}, f, indent=4)
+        return buckets
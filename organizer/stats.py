@@ -0,0 +1,170 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+# Latency histogram upper bounds in seconds, 100us doubling up to about a minute
+BUCKETS = [0.0001 * 2 ** i for i in range(20)]
+
+def human(size):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.2f} {unit}"
+        size /= 1024
+
+def parse_size(text):
+    """
+    Bytes from a size such as 512, 40M or 1.5GiB, the inverse of human()
+    """
+    text = text.strip().upper().removesuffix("B").removesuffix("I")
+    scale = 1
+    if text and text[-1] in "KMGT":
+        scale = 1024 ** ("KMGT".index(text[-1]) + 1)
+        text = text[:-1]
+    return int(float(text) * scale)
+
+class Stats:
+    """
+    Wall and CPU time per phase of a run plus latency histograms for single operations.
+    Phases nest exclusively: time spent in an inner phase is not counted for the outer one,
+    so interleaved generators (scan feeding metadata feeding the planner) split cleanly.
+    Phases are entered by the organizer's own thread only, and their CPU time is the process's
+    (process_time deltas), so the hash, copy and metadata pools count towards the phase they work for.
+    Work of threads running side by side with a phase, such as the source scanners, is counted
+    for whatever phase is current, and conversion worker processes are not counted at all.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.wall = defaultdict(float)
+        self.cpu = defaultdict(float)
+        self.files = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.hist = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.latency = defaultdict(float)
+        self.__stack = []
+        self.__mark = None
+        self.__lock = threading.Lock()
+
+    def __switch(self):
+        now = (time.perf_counter(), time.process_time())
+        if self.__stack:
+            self.wall[self.__stack[-1]] += now[0] - self.__mark[0]
+            self.cpu[self.__stack[-1]] += now[1] - self.__mark[1]
+        self.__mark = now
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a block of the calling thread as phase name
+        """
+        self.__switch()
+        self.__stack.append(name)
+        try:
+            yield
+        finally:
+            self.__switch()
+            self.__stack.pop()
+
+    def timed(self, name, iterable, size=None):
+        """
+        Pass iterable through, counting the time spent producing each item as phase name.
+        size optionally gives the bytes each item stands for.
+        """
+        it = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            self.count(name, 1, size(item) if size else 0)
+            yield item
+
+    def count(self, name, files=1, size=0):
+        with self.__lock:
+            self.files[name] += files
+            self.bytes[name] += size
+
+    def record(self, name, seconds, size=0):
+        """
+        One operation of phase name, from any thread: adds to its histogram and counters
+        """
+        with self.__lock:
+            self.hist[name][bisect.bisect_left(BUCKETS, seconds)] += 1
+            self.latency[name] += seconds
+            self.files[name] += 1
+            self.bytes[name] += size
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        phases = {}
+        for name in sorted(set(self.wall) | set(self.files)):
+            wall = self.wall.get(name, 0.0)
+            phases[name] = {
+                "wall_seconds": round(wall, 6),
+                "cpu_seconds": round(self.cpu.get(name, 0.0), 6),
+                "files": self.files.get(name, 0),
+                "bytes": self.bytes.get(name, 0),
+                "files_per_second": round(self.files.get(name, 0) / wall, 2) if wall else None,
+                "bytes_per_second": round(self.bytes.get(name, 0) / wall, 2) if wall else None,
+            }
+        return {
+            "wall_seconds": round(elapsed, 6),
+            "cpu_seconds": round(time.process_time() - self.cpu_started, 6),
+            "phases": phases,
+            "latency": {name: {"buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], counts)),
+                               "count": sum(counts), "sum_seconds": round(self.latency[name], 6)}
+                        for name, counts in self.hist.items()},
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=4)
+
+    def write_prometheus(self, path):
+        """
+        Prometheus text exposition format, for node_exporter's textfile collector
+        """
+        report = self.report()
+        lines = [
+            "# TYPE filefusion_run_seconds gauge",
+            f"filefusion_run_seconds {report['wall_seconds']}",
+            "# TYPE filefusion_phase_seconds gauge",
+            *(f'filefusion_phase_seconds{{phase="{n}"}} {p["wall_seconds"]}' for n, p in report["phases"].items()),
+            "# TYPE filefusion_phase_cpu_seconds gauge",
+            *(f'filefusion_phase_cpu_seconds{{phase="{n}"}} {p["cpu_seconds"]}' for n, p in report["phases"].items()),
+            "# TYPE filefusion_phase_files gauge",
+            *(f'filefusion_phase_files{{phase="{n}"}} {p["files"]}' for n, p in report["phases"].items()),
+            "# TYPE filefusion_phase_bytes gauge",
+            *(f'filefusion_phase_bytes{{phase="{n}"}} {p["bytes"]}' for n, p in report["phases"].items()),
+        ]
+        for name, counts in self.hist.items():
+            metric = f"filefusion_{name}_latency_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            total = 0
+            for bound, n in zip([str(b) for b in BUCKETS] + ["+Inf"], counts):
+                total += n
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {total}')
+            lines.append(f"{metric}_sum {self.latency[name]}")
+            lines.append(f"{metric}_count {total}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
@@ -0,0 +1,137 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from organizer.index import Index, STATE_DIR
+from organizer.scanner import scan
+
+SIZE = 128
+QUALITY = 80
+# Formats Pillow decodes out of the box; raw and vector formats get a placeholder
+SUFFIXES = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp", ".ico"}
+
+def render(source, target, size=SIZE):
+    """
+    Write a JPEG thumbnail of source to target, in a worker process. Returns target, or None if unreadable.
+    """
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(source) as img:
+            # JPEGs decode straight at 1/2 to 1/8 scale, so a 24 MP photo never gets decoded in full
+            img.draft("RGB", (size, size))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size))
+            if img.mode != "RGB": img = img.convert("RGB")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            part = target + ".part"
+            img.save(part, "JPEG", quality=QUALITY)
+        os.replace(part, target)
+        return target
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        return None
+
+def images(library):
+    """
+    Every file under library that can get a thumbnail, as FileRecords in scan order
+    """
+    for record in scan(library, skip_hidden=True):
+        if os.path.splitext(record.path)[1].lower() in SUFFIXES:
+            yield record
+
+class ThumbnailCache:
+    """
+    Thumbnails of a library in <library>/.filefusion/thumbs, one small JPEG per file.
+    Files are keyed by their content hash when the index knows it and the file still has the size
+    and mtime it was organized with, so duplicates share one, and by (path, size, mtime) otherwise
+    so an edited file gets a new one.
+    Missing thumbnails are rendered on a process pool and show up in finished() once written.
+    """
+    def __init__(self, library, workers=None):
+        self.folder = os.path.join(library, STATE_DIR, "thumbs")
+        os.makedirs(self.folder, exist_ok=True)
+        # Read only: browsing a library never writes to its index
+        index = Index(library, read_only=True)
+        self.digests = index.digests()
+        index.close()
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.__pool = None
+        self.__pending = {}
+        self.__failed = set()
+        self.__finished = []
+        self.__lock = threading.Lock()
+
+    def key(self, record):
+        known = self.digests.get(os.path.abspath(record.path))
+        if known and known[:2] == (record.size, record.mtime): return known[2]
+        return hashlib.blake2b(f"{record.path}\0{record.size}\0{record.mtime}".encode(), digest_size=16).hexdigest()
+
+    def path(self, key):
+        # Sharded by the first byte so no folder ends up with 100k entries
+        return os.path.join(self.folder, key[:2], key + ".jpg")
+
+    def get(self, record):
+        """
+        Path of the record's thumbnail if it exists, else None after queueing it for rendering
+        """
+        key = self.key(record)
+        target = self.path(key)
+        if os.path.exists(target):
+            return target
+        with self.__lock:
+            if key in self.__pending or key in self.__failed:
+                return None
+            if self.__pool is None:
+                self.__pool = ProcessPoolExecutor(self.workers)
+            future = self.__pool.submit(render, record.path, target)
+            self.__pending[key] = future
+        future.add_done_callback(lambda f, key=key: self.__done(key, f))
+        return None
+
+    def __done(self, key, future):
+        with self.__lock:
+            self.__pending.pop(key, None)
+            if future.cancelled(): return
+            if future.exception() or future.result() is None: self.__failed.add(key)
+            else: self.__finished.append(key)
+
+    def finished(self):
+        """
+        Keys rendered since the last call
+        """
+        with self.__lock:
+            done, self.__finished = self.__finished, []
+        return done
+
+    def failed(self, record):
+        return self.key(record) in self.__failed
+
+    def keep(self, records):
+        """
+        Drop queued renders for anything but records, the ones on screen, so fast scrolling
+        doesn't leave thousands of thumbnails nobody will look at in the queue
+        """
+        wanted = {self.key(r) for r in records}
+        with self.__lock:
+            stale = [f for k, f in self.__pending.items() if k not in wanted]
+        for future in stale: future.cancel()
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=False, cancel_futures=True)
+            self.__pool = None
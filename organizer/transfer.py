@@ -0,0 +1,203 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import errno
+import shutil
+import threading
+from organizer.enums import Strategy
+from organizer.duplicates import hasher
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FICLONE = 0x40049409
+CHUNK = 1048576
+
+def _copy_file_range(fsrc, fdst):
+    while os.copy_file_range(fsrc.fileno(), fdst.fileno(), CHUNK * 64):
+        pass
+
+def _sendfile(fsrc, fdst):
+    offset = 0
+    while sent := os.sendfile(fdst.fileno(), fsrc.fileno(), offset, CHUNK * 64):
+        offset += sent
+
+def _readwrite(fsrc, fdst):
+    shutil.copyfileobj(fsrc, fdst, CHUNK)
+
+_KERNEL_COPY = [f for name, f in (("copy_file_range", _copy_file_range), ("sendfile", _sendfile)) if hasattr(os, name)]
+
+def fast_copy(src, dst):
+    """
+    Copy data and metadata, letting the kernel move the bytes when it can.
+    copy_file_range also allows server side copies on NFS and SMB mounts.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        for copy in _KERNEL_COPY + [_readwrite]:
+            try:
+                copy(fsrc, fdst)
+                break
+            except OSError:
+                if copy is _readwrite: raise
+                # Unsupported for this pair of files, start over with the next method
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+    shutil.copystat(src, dst)
+
+def publish(src, target, replace=False):
+    """
+    Rename src to target. Unless replace is set an existing target is never overwritten:
+    a hardlink fails if target exists, and only then is src unlinked.
+    """
+    if replace:
+        os.replace(src, target)
+        return
+    try:
+        os.link(src, target)
+    except FileExistsError:
+        raise
+    except OSError:
+        # No hardlinks on this filesystem, check first and accept the narrow race
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+        os.rename(src, target)
+        return
+    os.remove(src)
+
+def copy_hash(src, dst):
+    """
+    Copy src to dst through one buffer, hashing every block on its way through.
+    Returns the same hash full_hash() would, without reading either file a second time.
+    """
+    h = hasher()
+    buf = bytearray(CHUNK)
+    view = memoryview(buf)
+    with open(src, "rb", buffering=0) as fsrc, open(dst, "wb", buffering=0) as fdst:
+        while n := fsrc.readinto(buf):
+            h.update(view[:n])
+            written = 0
+            while written < n:
+                written += fdst.write(view[written:n])
+    shutil.copystat(src, dst)
+    return h.hexdigest()
+
+def reflink(src, dst):
+    """
+    Clone src into dst sharing the same blocks (btrfs, XFS, APFS style copy on write)
+    """
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+class Transfer:
+    """
+    Puts a file at its destination with the cheapest method the chosen strategy allows.
+    Anything that can't work across filesystems falls back to a real copy.
+    With checksum, real copies hash the data as it streams through and return the hash.
+    """
+    def __init__(self, strategy=Strategy.COPY, checksum=False):
+        self.strategy = Strategy(strategy)
+        self.checksum = checksum
+        self.__devices = {}
+        self.__no_reflink = set()
+        self.__lock = threading.Lock()
+
+    def same_device(self, src, target, device=None):
+        """
+        Whether src and target share a filesystem, checked once per pair of folders
+        """
+        key = (os.path.dirname(src), os.path.dirname(target))
+        same = self.__devices.get(key)
+        if same is None:
+            if device is None: device = os.stat(key[0]).st_dev
+            same = self.__devices[key] = device == os.stat(key[1]).st_dev
+        return same
+
+    def __call__(self, src, target, device=None, replace=False):
+        """
+        Put src at target; returns the content hash when one was computed on the way, else None.
+        An existing target raises FileExistsError unless replace is set.
+        """
+        part, digest = self.stage(src, target, device)
+        self.commit(src, part, target, replace)
+        return digest
+
+    def stage(self, src, target, device=None, tag=""):
+        """
+        First half of a transfer: put the data of src in the part file .<name><tag>.part next to target,
+        so a crash never leaves a half written target. Returns (part, hash or None).
+        A same-device move has nothing to stage and its part is src itself.
+        """
+        same = self.same_device(src, target, device)
+        if self.strategy == Strategy.MOVE and same:
+            return src, None
+        folder, name = os.path.split(target)
+        part = os.path.join(folder, f".{name}{tag}.part")
+        try:
+            return part, self.__place(src, part, same)
+        except BaseException:
+            self.discard(src, part)
+            raise
+
+    def commit(self, src, part, target, replace=False):
+        """
+        Second half: give the staged part its final name, which may differ from the one it was
+        staged for as long as it is in the same folder, and remove src after a move
+        """
+        try:
+            publish(part, target, replace)
+        except BaseException:
+            self.discard(src, part)
+            raise
+        if self.strategy == Strategy.MOVE and part != src:
+            os.remove(src)
+
+    @staticmethod
+    def discard(src, part):
+        """
+        Drop a staged part that won't be committed
+        """
+        if part != src and os.path.lexists(part): os.remove(part)
+
+    def __place(self, src, part, same):
+        if os.path.lexists(part):
+            os.remove(part)
+        if self.strategy == Strategy.HARDLINK and same:
+            try:
+                os.link(src, part)
+                return None
+            except OSError:
+                pass
+        if self.strategy in (Strategy.REFLINK, Strategy.AUTO) and same:
+            key = os.path.dirname(part)
+            if key not in self.__no_reflink:
+                try:
+                    reflink(src, part)
+                    return None
+                except OSError:
+                    # Remember filesystems without clone support instead of failing on every file
+                    if self.strategy == Strategy.AUTO:
+                        with self.__lock: self.__no_reflink.add(key)
+        if self.checksum:
+            return copy_hash(src, part)
+        fast_copy(src, part)
+        return None
@@ -0,0 +1,161 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from organizer import FileOrganizer
+from organizer.scanner import scan
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+EVENT = struct.Struct("iIII")
+
+class PollingWatcher:
+    """
+    Fallback for platforms without inotify: rescans the tree every interval seconds
+    and reports files whose size or mtime changed
+    """
+    def __init__(self, source, interval=2.0):
+        self.source = source
+        self.interval = interval
+        self.seen = self.__snapshot()
+
+    def __snapshot(self):
+        return {r.path: (r.size, r.mtime) for r in scan(self.source, skip_hidden=True)}
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        now = self.__snapshot()
+        changed = [p for p, v in now.items() if self.seen.get(p) != v]
+        self.seen = now
+        return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """
+    Recursive inotify watch; blocks in the kernel until something happens, so an idle watch costs nothing
+    """
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, source):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.source = source
+        self.dirs = {}
+        self.__add_tree(source)
+
+    def __add(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK)
+        if wd >= 0:
+            self.dirs[wd] = folder
+
+    def __add_tree(self, root):
+        self.__add(root)
+        for folder, dirs, _ in os.walk(root):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for d in dirs:
+                self.__add(os.path.join(folder, d))
+
+    def wait(self, timeout=None):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 65536)
+        changed = []
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # The kernel dropped events, every file has to be looked at again
+                changed.extend(r.path for r in scan(self.source, skip_hidden=True))
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            if wd not in self.dirs or not name:
+                continue
+            path = os.path.join(self.dirs[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not os.path.basename(path).startswith("."):
+                    # Files can land in a new folder before its watch exists, so pick those up too
+                    self.__add_tree(path)
+                    changed.extend(r.path for r in scan(path, skip_hidden=True))
+            else:
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def open_watcher(source):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(source)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(source)
+
+def watch(source, dest, ext, settle=2.0, stop=None, **options):
+    """
+    Organize files as they arrive in source. A file is picked up once it has had no
+    events for settle seconds, and everything that settled together is organized as one batch.
+    stop is an optional threading.Event that ends the watch.
+    """
+    watcher = open_watcher(source)
+    dest = os.path.abspath(dest)
+    pending = {}
+    print(f"Watching '{source}', press Ctrl+C to stop")
+    try:
+        while not (stop and stop.is_set()):
+            now = time.monotonic()
+            if pending:
+                timeout = max(0.0, settle - (now - min(pending.values())))
+            else:
+                # With a stop event the loop wakes up once a second to check it, otherwise it sleeps until an event
+                timeout = 1.0 if stop else None
+            for path in watcher.wait(timeout):
+                name = os.path.basename(path)
+                if name.startswith(".") or os.path.abspath(path).startswith(dest + os.sep):
+                    continue
+                pending[path] = time.monotonic()
+
+            now = time.monotonic()
+            ready = sorted(p for p, t in pending.items() if now - t >= settle)
+            for p in ready:
+                del pending[p]
+            ready = [p for p in ready if os.path.isfile(p)]
+            if ready:
+                FileOrganizer(source, dest, ext, files=ready, **options)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
@@ -0,0 +1,36 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from datetime import datetime
+from organizer.scanner import FileRecord
+
+MAY = datetime(2024, 5, 3).timestamp()
+
+def write(path, data, mtime=MAY):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+    return path
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+def record(path):
+    st = os.stat(path)
+    return FileRecord(str(path), st.st_size, st.st_mtime, st.st_ino, st.st_dev)
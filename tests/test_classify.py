@@ -0,0 +1,39 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from organizer import FileOrganizer
+from organizer.classify import sniff
+
+def test_sniff_by_magic_bytes(tmp_path):
+    headers = {".jpg": b"\xff\xd8\xff\xe0", ".png": b"\x89PNG\r\n\x1a\n", ".heic": b"\0\0\0\x18ftypheic",
+               ".mp4": b"\0\0\0\x18ftypisom", ".mov": b"\0\0\0\x14ftypqt  ", ".webp": b"RIFF\0\0\0\0WEBP"}
+    for suffix, head in headers.items():
+        path = tmp_path / suffix[1:]
+        path.write_bytes(head + b"\0" * 64)
+        assert sniff(str(path)) == suffix
+    (tmp_path / "text").write_bytes(b"plain text")
+    assert sniff(str(tmp_path / "text")) is None
+    assert sniff(str(tmp_path / "missing")) is None
+
+def test_file_without_a_suffix_is_filed_by_its_content(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "IMG_0001").write_bytes(b"\xff\xd8\xff\xe0" + b"\0" * 64)
+    (tmp_path / "src" / "IMG_0002.jpg").write_bytes(b"\xff\xd8\xff\xe0" + b"\0" * 64)
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"])
+    [folder] = [f for f, _, files in os.walk(dest) if "IMG_0002.jpg" in files]
+    assert sorted(os.listdir(folder)) == ["IMG_0001", "IMG_0002.jpg"]
@@ -0,0 +1,51 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import time
+from organizer.job import Job
+from helpers import write
+
+def files(tmp_path, n=10):
+    for i in range(n):
+        write(tmp_path / "src" / f"{i}.txt", str(i))
+    return str(tmp_path / "src"), str(tmp_path / "dest")
+
+def test_paused_job_waits_until_resumed(tmp_path):
+    source, dest = files(tmp_path)
+    job = Job(source, dest, ["type"])
+    job.pause()
+    job.start()
+    time.sleep(0.2)
+    assert job.alive() and job.paused
+    assert not os.path.exists(os.path.join(dest, "other"))
+    job.resume()
+    job.thread.join(10)
+    assert not job.alive() and job.error is None
+    assert len(os.listdir(os.path.join(dest, "other"))) == 10
+    assert job.latest().phase == "done"
+
+def test_cancelled_job_stops_without_copying(tmp_path):
+    source, dest = files(tmp_path)
+    job = Job(source, dest, ["type"])
+    job.pause()
+    job.start()
+    time.sleep(0.1)
+    job.cancel()
+    job.thread.join(10)
+    assert not job.alive() and job.error is None
+    assert not os.path.exists(os.path.join(dest, "other"))
+    assert job.latest().phase == "cancelled"
@@ -0,0 +1,55 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from organizer import FileOrganizer
+from organizer.journal import Journal
+from organizer.plan import entry
+from organizer.transfer import Transfer
+from helpers import write, record
+
+def test_journal_remembers_finished_transfers(tmp_path):
+    first, second = (entry(record(write(tmp_path / n, n)), f"/dest/{n}", "copy") for n in ("a", "b"))
+    journal = Journal(str(tmp_path))
+    journal.plan([first, second])
+    journal.done(first)
+    journal.close()
+    resumed = Journal(str(tmp_path), resume=True)
+    assert resumed.is_finished(first) and not resumed.is_finished(second)
+    assert not resumed.is_finished(first._replace(size=99))
+    resumed.close(complete=True)
+    assert not os.path.exists(resumed.path)
+
+def test_resume_after_an_interrupted_run(tmp_path, monkeypatch):
+    for n in range(5):
+        write(tmp_path / "src" / f"{n}.txt", str(n))
+    dest = tmp_path / "dest"
+    copied = []
+    transfer = Transfer.__call__
+    def interrupted(self, src, target, *args):
+        if len(copied) == 2: raise KeyboardInterrupt()
+        copied.append(os.path.basename(src))
+        return transfer(self, src, target, *args)
+    monkeypatch.setattr(Transfer, "__call__", interrupted)
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"])
+    assert sorted(os.listdir(dest / "other")) == sorted(copied)
+
+    monkeypatch.setattr(Transfer, "__call__", lambda self, src, *args: copied.append(os.path.basename(src))
+                        or transfer(self, src, *args))
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], resume=True)
+    assert sorted(copied) == [f"{n}.txt" for n in range(5)]
+    assert sorted(os.listdir(dest / "other")) == [f"{n}.txt" for n in range(5)]
+    assert not os.path.exists(dest / ".filefusion" / "journal.jsonl")
@@ -0,0 +1,43 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import time
+import logging
+import weakref
+from logger import Logger, _noop
+
+def test_loggers_share_one_listener_and_level(tmp_path, monkeypatch):
+    # A fresh setup, writing its logs/ folder under tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("FILEFUSION_LOG_JSON", raising=False)
+    monkeypatch.setattr(Logger, "_Logger__listener", None)
+    monkeypatch.setattr(Logger, "_Logger__console", None)
+    monkeypatch.setattr(Logger, "_Logger__instances", weakref.WeakSet())
+
+    first = Logger(level=logging.INFO)
+    second = Logger()
+    assert len(first.logger.handlers) == 1
+    assert first.debug is _noop
+    # Setting the level on one instance rebinds debug on every one
+    second.set_level(logging.DEBUG)
+    first.debug("debug %s", "message")
+    log = tmp_path / "logs" / "filefusion.log"
+    for _ in range(500):
+        if log.exists() and "debug message" in log.read_text(): break
+        time.sleep(0.01)
+    assert "debug message" in log.read_text()
+    first.set_level(logging.INFO)
+    assert second.debug is _noop
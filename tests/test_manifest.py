@@ -0,0 +1,40 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from organizer import FileOrganizer
+from organizer.manifest import MANIFEST, read, verify
+from helpers import write
+
+def test_verify_finds_damaged_and_missing_files(tmp_path):
+    for name in ("a", "b", "c", "d"):
+        write(tmp_path / "src" / f"{name}.txt", name * 10)
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], checksum=True)
+    folder = dest / "other"
+    assert sorted(read(str(folder))) == ["a.txt", "b.txt", "c.txt", "d.txt"]
+    assert all(row.hash for row in read(str(folder)).values())
+    assert verify(str(dest)) == []
+
+    # Same size, other content; shorter; gone
+    write(folder / "a.txt", "z" * 10)
+    write(folder / "b.txt", "b")
+    os.remove(folder / "c.txt")
+    problems = dict(verify(str(dest)))
+    assert problems == {str(folder / "a.txt"): "content changed", str(folder / "b.txt"): "size changed",
+                        str(folder / "c.txt"): "missing"}
+    assert len(verify(str(dest), sample=0.5, seed=1)) <= 2
+    assert os.path.exists(folder / MANIFEST)
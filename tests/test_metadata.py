@@ -0,0 +1,30 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+from datetime import datetime
+from benchmark import exif_jpeg, quicktime
+from organizer.metadata import capture_time
+
+def test_capture_time_from_headers(tmp_path):
+    taken = datetime(2019, 7, 14, 9, 30).timestamp()
+    rng = random.Random(1)
+    for name, data in [("a.jpg", exif_jpeg(taken, 4096, rng)), ("b.mp4", quicktime(taken, 4096, rng))]:
+        path = tmp_path / name
+        path.write_bytes(data)
+        assert capture_time(str(path), len(data)) == taken
+    (tmp_path / "c.jpg").write_bytes(b"\xff\xd8" + b"\0" * 64)
+    assert capture_time(str(tmp_path / "c.jpg"), 66) is None
@@ -0,0 +1,246 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import time
+import threading
+import zipfile
+import pytest
+from organizer import FileOrganizer, _Budget
+from organizer.duplicates import PARTIAL, find_duplicates
+from organizer.scanner import FileRecord, scan_sources
+from helpers import MAY, write, read, record
+
+def test_move_never_overwrites_an_earlier_run(tmp_path):
+    write(tmp_path / "m1" / "IMG_0001.JPG", "one")
+    write(tmp_path / "m2" / "IMG_0001.JPG", "two")
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "m1"), str(dest), ["date"], strategy="move")
+    FileOrganizer(str(tmp_path / "m2"), str(dest), ["date"], strategy="move")
+    month = dest / "2024" / "May"
+    assert read(month / "IMG_0001.JPG") == "one"
+    assert read(month / "IMG_0001 (1).JPG") == "two"
+
+def test_copy_never_overwrites_an_earlier_run(tmp_path):
+    dest = tmp_path / "dest"
+    write(tmp_path / "a" / "notes.txt", "first")
+    FileOrganizer(str(tmp_path / "a"), str(dest), ["type"])
+    write(tmp_path / "b" / "notes.txt", "second")
+    FileOrganizer(str(tmp_path / "b"), str(dest), ["type"])
+    assert sorted(os.listdir(dest / "other")) == ["notes (1).txt", "notes.txt"]
+    assert read(dest / "other" / "notes.txt") == "first"
+
+def test_indexed_file_replaces_its_own_output(tmp_path):
+    source = write(tmp_path / "src" / "notes.txt", "first")
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], index=True)
+    write(source, "changed")
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], index=True)
+    assert os.listdir(dest / "other") == ["notes.txt"]
+    assert read(dest / "other" / "notes.txt") == "changed"
+
+def test_zip_member_without_a_date(tmp_path):
+    archive = tmp_path / "photos.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr(zipfile.ZipInfo("zeroed.txt", (1980, 0, 0, 0, 0, 0)), "zeroed")
+        z.writestr(zipfile.ZipInfo("dated.txt", (2024, 5, 3, 12, 0, 0)), "dated")
+    dest = tmp_path / "dest"
+    FileOrganizer([str(archive)], str(dest), ["type"])
+    assert sorted(os.listdir(dest / "other")) == ["dated.txt", "zeroed.txt"]
+
+def test_compressed_tar_is_read_once(tmp_path, monkeypatch):
+    import tarfile
+    from organizer import archive
+    write(tmp_path / "x" / "a.txt", "a")
+    with tarfile.open(tmp_path / "x.tar.gz", "w:gz") as t:
+        t.add(tmp_path / "x" / "a.txt", arcname="a.txt")
+        t.add(tmp_path / "x" / "a.txt", arcname="../escape.txt")
+    opened = []
+    real = tarfile.open
+    monkeypatch.setattr(archive.tarfile, "open", lambda *args, **kwargs: opened.append(args) or real(*args, **kwargs))
+    dest = tmp_path / "dest"
+    FileOrganizer([str(tmp_path / "x.tar.gz")], str(dest), ["type"])
+    assert len(opened) == 1
+    # A member climbing out of the archive is left out
+    assert os.listdir(dest / "other") == ["a.txt"]
+
+def test_destination_inside_the_source_is_not_scanned(tmp_path):
+    write(tmp_path / "in" / "a.txt", "a")
+    dest = tmp_path / "in" / "out"
+    for _ in range(2):
+        FileOrganizer(str(tmp_path / "in"), str(dest), ["type"], index=True)
+    assert os.listdir(dest / "other") == ["a.txt"]
+
+def test_scan_error_reaches_the_consumer():
+    def walk(source, skip_hidden, exclude):
+        yield FileRecord(os.path.join(source, "first"), 1, 0.0, 0, 0)
+        raise PermissionError(source)
+    with pytest.raises(PermissionError):
+        list(scan_sources(["a", "b"], walk=walk))
+
+def test_fast_source_copies_while_a_slow_one_is_scanned(tmp_path, monkeypatch):
+    import organizer
+    slow, fast = tmp_path / "slow", tmp_path / "fast"
+    write(slow / "notes.txt", "slow")
+    write(fast / "notes.txt", "fast")
+    dest = tmp_path / "dest"
+    staged = []
+    scan = organizer.scan
+
+    def slow_scan(source, skip_hidden, exclude):
+        if source == str(slow):
+            # Hold the first source's scan until the second source has staged its copy
+            folder = dest / "other"
+            for _ in range(500):
+                if folder.exists(): staged[:] = [n for n in os.listdir(folder) if n.endswith(".part")]
+                if staged: break
+                time.sleep(0.01)
+        return scan(source, skip_hidden, exclude)
+    monkeypatch.setattr(organizer, "scan", slow_scan)
+    FileOrganizer([str(slow), str(fast)], str(dest), ["type"])
+    assert staged
+    # Names still go by source order, however the lanes finish
+    assert read(dest / "other" / "notes.txt") == "slow"
+    assert read(dest / "other" / "notes (1).txt") == "fast"
+    assert sorted(os.listdir(dest / "other")) == ["notes (1).txt", "notes.txt"]
+
+def test_size_buckets_stay_the_same_across_runs(tmp_path):
+    dest = tmp_path / "dest"
+    write(tmp_path / "few" / "tiny.txt", "x")
+    FileOrganizer(str(tmp_path / "few"), str(dest), ["size"], dry_run=True)
+    assert not os.path.exists(dest / ".filefusion" / "sizes.json")
+    FileOrganizer(str(tmp_path / "few"), str(dest), ["size"])
+    for n in range(150):
+        write(tmp_path / "many" / f"{n}.txt", "x" * (n * 997))
+    FileOrganizer(str(tmp_path / "many"), str(dest), ["size"])
+    assert sorted(os.listdir(dest)) == [".filefusion", "small"]
+
+def test_dry_run_leaves_the_destination_alone(tmp_path):
+    write(tmp_path / "src" / "IMG_0001.JPG", "one")
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["date", "size"], index=True, dry_run=True)
+    assert not os.path.exists(dest)
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["date"], index=True)
+    before = sorted(os.listdir(dest / ".filefusion"))
+    write(tmp_path / "src" / "IMG_0002.JPG", "two")
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["date"], index=True, dry_run=True)
+    assert sorted(os.listdir(dest / ".filefusion")) == before
+
+def test_empty_files_are_not_duplicates(tmp_path):
+    write(tmp_path / "src" / "empty1.txt", "")
+    write(tmp_path / "src" / "empty2.txt", "")
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], duplicates="skip")
+    assert sorted(os.listdir(dest / "other")) == ["empty1.txt", "empty2.txt"]
+
+def test_duplicate_of_an_unplaced_original_is_organized(tmp_path, monkeypatch):
+    organize = FileOrganizer.organize
+    # The first copy can't be placed, as when its rules raise
+    monkeypatch.setattr(FileOrganizer, "organize", lambda self, record, *args:
+                        None if record.path.endswith("a.txt") else organize(self, record, *args))
+    for name in ("a.txt", "b.txt", "c.txt"):
+        write(tmp_path / "src" / name, "same")
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["date"], duplicates="skip")
+    assert os.listdir(dest / "2024" / "May") == ["b.txt"]
+
+def test_duplicates_need_the_same_full_content(tmp_path):
+    head = "x" * PARTIAL
+    paths = [write(tmp_path / name, data) for name, data in [
+        ("a", head + "1" * PARTIAL + head), ("b", head + "2" * PARTIAL + head),  # same ends, middle differs
+        ("c", head + "1" * PARTIAL + head), ("d", "small"), ("e", "small"), ("f", "other")]]
+    hashes = {}
+    groups = find_duplicates([record(p) for p in paths], 2, hashes)
+    assert [[os.path.basename(r.path) for r in g] for g in groups] == [["a", "c"], ["d", "e"]]
+    # Only the large files that still collided after the partial hash were read in full
+    assert {os.path.basename(p) for p, (_, full) in hashes.items() if full} == {"a", "b", "c"}
+
+def test_summary_counts_finished_transfers(tmp_path, capsys):
+    for n in range(3):
+        write(tmp_path / "src" / f"{n}.txt", "x" * 10)
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], plan_out=str(tmp_path / "plan.jsonl"))
+    assert "Organized 3 files (30 B)" in capsys.readouterr().out
+    # Replaying the same plan finds every target taken
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], replay=str(tmp_path / "plan.jsonl"))
+    out = capsys.readouterr().out
+    assert "Failed to organize 3 files" in out and "Organized 0 files (0 B)" in out
+
+def test_changed_file_replaces_its_old_conversion(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    source = tmp_path / "src" / "b.tif"
+    source.parent.mkdir()
+    Image.new("RGB", (8, 8), "red").save(source)
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], converter=True, index=True)
+    [folder] = [f for f, _, files in os.walk(dest) if "b.tif" in files]
+    Image.new("RGB", (16, 16), "blue").save(source)
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], converter=True, index=True)
+    assert sorted(os.listdir(folder)) == ["b.jpg", "b.tif"]
+    with Image.open(os.path.join(folder, "b.jpg")) as img:
+        assert img.size == (16, 16)
+
+def test_conversion_reuses_the_cache(tmp_path, capsys):
+    Image = pytest.importorskip("PIL.Image")
+    for name in ("first", "second"):
+        (tmp_path / name).mkdir()
+        Image.new("RGB", (8, 8), "red").save(tmp_path / name / f"{name}.tif")
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "first"), str(dest), ["type"], converter=True)
+    assert "Converted 1 files, 0 of them reused" in capsys.readouterr().out
+    # Same content under another name: its output comes from the cache, not the encoder
+    FileOrganizer(str(tmp_path / "second"), str(dest), ["type"], converter=True)
+    assert "Converted 1 files, 1 of them reused" in capsys.readouterr().out
+    [folder] = [f for f, _, files in os.walk(dest) if "first.tif" in files]
+    assert sorted(os.listdir(folder)) == ["first.jpg", "first.tif", "second.jpg", "second.tif"]
+
+def test_thumbnail_keys_follow_edits(tmp_path):
+    from organizer.duplicates import hasher
+    from organizer.thumbnails import ThumbnailCache, images
+    write(tmp_path / "src" / "a.jpg", "a")
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], index=True, checksum=True)
+    state = sorted(os.listdir(dest / ".filefusion"))
+    [record] = images(str(dest))
+    h = hasher()
+    h.update(b"a")
+    assert ThumbnailCache(str(dest)).key(record) == h.hexdigest()
+    # An edited file no longer has the content the index hashed
+    write(record.path, "b", MAY + 60)
+    [edited] = images(str(dest))
+    assert ThumbnailCache(str(dest)).key(edited) != h.hexdigest()
+    # Browsing leaves the index alone
+    assert sorted(os.listdir(dest / ".filefusion")) == state + ["thumbs"]
+
+def test_budget_holds_copies_back_until_bytes_are_released():
+    budget = _Budget(100, 4)
+    # A file larger than the whole budget still goes through on its own
+    budget.acquire(1000)
+    queued = threading.Event()
+    worker = threading.Thread(target=lambda: (budget.acquire(10), queued.set()))
+    worker.start()
+    assert not queued.wait(0.2)
+    budget.release(1000)
+    assert queued.wait(5)
+    worker.join()
+
+def test_workers_copy_every_file(tmp_path):
+    for n in range(40):
+        write(tmp_path / "src" / f"{n}.txt", str(n))
+    dest = tmp_path / "dest"
+    FileOrganizer(str(tmp_path / "src"), str(dest), ["type"], workers=4)
+    assert sorted(os.listdir(dest / "other")) == sorted(f"{n}.txt" for n in range(40))
+    assert all(read(dest / "other" / f"{n}.txt") == str(n) for n in range(40))
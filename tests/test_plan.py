@@ -0,0 +1,24 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from organizer.plan import entry, read_plan, write_plan
+from helpers import write, record
+
+def test_plan_round_trip(tmp_path):
+    source = record(write(tmp_path / "a.txt", "a"))
+    plan = [entry(source, "/dest/a.txt", "copy"), entry(source, "/dest/b.txt", "link", "/dest/a.txt")]
+    write_plan(tmp_path / "plan.jsonl", plan)
+    assert read_plan(tmp_path / "plan.jsonl") == plan
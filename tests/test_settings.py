@@ -0,0 +1,45 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+import shutil
+from organizer import enums
+from organizer.enums import Settings
+
+def test_settings_reload_only_after_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "settings.json"
+    shutil.copy(enums.PATH, path)
+    monkeypatch.setattr(enums, "PATH", str(path))
+    monkeypatch.setattr(Settings, "CHECK", 0)
+    for name, value in (("data", None), ("views", {}), ("mtime", None), ("checked", 0.0)):
+        monkeypatch.setattr(Settings, f"_Settings__{name}", value)
+
+    types = Settings().get_types()
+    # Every instance shares the parsed file and what is built from it
+    assert Settings().get_types() is types
+    with open(path) as f:
+        data = json.load(f)
+    data["types"]["notes"] = [".note"]
+    with open(path, "w") as f:
+        json.dump(data, f)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    assert Settings().get_types()[0][".note"] == "notes"
+
+    Settings().update(lambda d: d["types"].__setitem__("notes", [".memo"]))
+    assert Settings().get_types()[0][".memo"] == "notes"
+    with open(path) as f:
+        assert json.load(f)["types"]["notes"] == [".memo"]
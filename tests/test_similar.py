@@ -0,0 +1,34 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+from organizer.similar import MultiIndex
+
+def test_multi_index_matches_brute_force():
+    rng = random.Random(1)
+    index = MultiIndex(8)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    for n, v in enumerate(values):
+        index.add(v, n)
+    for _ in range(300):
+        query = rng.choice(values)
+        for bit in rng.sample(range(64), rng.randint(0, 12)):
+            query ^= 1 << bit
+        distances = [(query ^ v).bit_count() for v in values]
+        best = min(distances)
+        found = index.nearest(query)
+        if best > 8: assert found is None
+        else: assert found == (best, distances.index(best))
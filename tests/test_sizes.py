@@ -0,0 +1,28 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+from organizer.sizes import SizeSketch
+
+def test_size_sketch_quantiles_within_one_percent():
+    rng = random.Random(1)
+    sizes = sorted(int(rng.lognormvariate(11, 2)) + 2 for _ in range(20000))
+    sketch = SizeSketch()
+    for size in sizes:
+        sketch.add(size)
+    for q in (0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+        exact = sizes[int(q * (len(sizes) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact + 1
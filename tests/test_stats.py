@@ -0,0 +1,49 @@
+"""
+Copyright 2024 Smarg1
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import time
+from organizer import FileOrganizer
+from organizer.stats import Stats, human, parse_size
+from helpers import write
+
+def test_nested_phases_split_their_time():
+    stats = Stats()
+    with stats.phase("outer"):
+        time.sleep(0.02)
+        with stats.phase("inner"):
+            time.sleep(0.2)
+    # The outer phase doesn't count the time spent in the inner one
+    assert 0.02 <= stats.wall["outer"] < 0.2 <= stats.wall["inner"]
+    stats.record("copy", 0.002, 10)
+    stats.record("copy", 100.0, 20)
+    latency = stats.report()["latency"]["copy"]
+    assert latency["count"] == 2 and latency["buckets"]["+Inf"] == 1
+    assert stats.files["copy"] == 2 and stats.bytes["copy"] == 30
+
+def test_run_report(tmp_path):
+    for n in range(3):
+        write(tmp_path / "src" / f"{n}.txt", "x" * 10)
+    report, metrics = tmp_path / "report.json", tmp_path / "metrics.prom"
+    FileOrganizer(str(tmp_path / "src"), str(tmp_path / "dest"), ["type"], report=str(report), metrics=str(metrics))
+    with open(report) as f:
+        copy = json.load(f)["phases"]["copy"]
+    assert copy["files"] == 3 and copy["bytes"] == 30
+    assert 'filefusion_phase_files{phase="copy"} 3' in metrics.read_text()
+
+def test_sizes_read_back():
+    assert parse_size("100M") == 100 * 1048576
+    assert human(1536) == "1.50 KiB"